@@ -1,32 +1,70 @@
 """
 FastAPI Server - REST API for Multi-Camera CCTV System
 """
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, File, UploadFile, Form, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import cv2
 import numpy as np
 import asyncio
-import json
+import hashlib
+import orjson
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import face_recognition
 import config
 from database import db
 from camera_manager import camera_manager
-from detection_engine import detection_engine
+from detection_engine import detection_engine, find_face_locations, frame_dhash
 
 logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# libjpeg-turbo decoder for uploaded frames (falls back to cv2.imdecode)
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    jpeg = TurboJPEG()
+    # Decode straight to the detection scale using the closest IDCT scaling
+    # factor libjpeg-turbo supports (1/2, 1/4, 1/8, ...)
+    jpeg_scaling_factor = min(
+        jpeg.scaling_factors,
+        key=lambda f: abs(f[0] / f[1] - config.FACE_DETECTION_SCALE)
+    )
+except Exception as e:
+    logger.info(f"TurboJPEG unavailable, using OpenCV for frame decoding: {e}")
+    jpeg = None
+    jpeg_scaling_factor = None
+
+# nvImageCodec (nvJPEG) decoder for GPU deployments such as Jetson
+gpu_decoder = None
+if config.USE_GPU_JPEG:
+    try:
+        from nvidia import nvimgcodec
+        gpu_decoder = nvimgcodec.Decoder()
+    except Exception as e:
+        logger.info(f"nvImageCodec unavailable, decoding frames on the CPU: {e}")
+
+# Thread pool for the CPU-bound /api/detect-frame pipeline
+detect_executor = ThreadPoolExecutor(max_workers=config.DETECT_WORKERS,
+                                     thread_name_prefix="detect")
+
+# Per-thread scratch buffers that uploaded frames are decoded into
+_decode_buffers = threading.local()
+
+# Last frame hash and detection result per device, for skipping near-duplicate frames
+_last_frame_results: Dict[str, Tuple[int, dict]] = {}
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Multi-Camera CCTV System",
     description="Smart CCTV system with face recognition and threat detection",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware for mobile access
@@ -68,46 +106,295 @@ class AlertAcknowledge(BaseModel):
 
 
 # WebSocket connection manager
+def encode_message(message: dict) -> str:
+    """Serialize a WebSocket message to JSON text"""
+    return orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # id(websocket) -> (websocket, outbound queue, writer task)
+        self.active_connections: Dict[int, Tuple[WebSocket, asyncio.Queue, asyncio.Task]] = {}
+        self.last_payload: Optional[str] = None  # Most recent update, sent to new clients
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue = asyncio.Queue(maxsize=100)
+        task = asyncio.create_task(self._writer(websocket, queue))
+        self.active_connections[id(websocket)] = (websocket, queue, task)
         logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+        if self.last_payload is not None:
+            queue.put_nowait(self.last_payload)
     
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        connection = self.active_connections.pop(id(websocket), None)
+        if connection is not None:
+            connection[2].cancel()
         logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
     
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue):
+        """Drain one client's outbound queue so slow clients only delay themselves"""
+        try:
+            while True:
+                payload = await queue.get()
+                await websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to websocket: {e}")
+            self.disconnect(websocket)
+    
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
+        """Serialize a message once and queue it for every client"""
+        self.broadcast_payload(encode_message(message))
+    
+    def broadcast_payload(self, payload: str):
+        """Queue an already serialized message for every client"""
+        self.last_payload = payload
+        
+        for _, queue, _ in self.active_connections.values():
             try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to websocket: {e}")
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Client is falling behind; updates are snapshots, so drop its oldest
+                queue.get_nowait()
+                queue.put_nowait(payload)
 
 
 manager = ConnectionManager()
+updates_task: Optional[asyncio.Task] = None
+
+# device_id -> id of its virtual "Device_<id>" camera, saves a lookup per batch
+device_camera_ids: Dict[str, int] = {}
+
+# Device detections waiting to be written to the database by detection_writer;
+# created at startup so it belongs to the server's running loop (on Python
+# 3.9 a queue binds to whatever loop exists when it is constructed)
+detection_queue: Optional[asyncio.Queue] = None
+writer_task: Optional[asyncio.Task] = None
+
+
+def _get_decode_buffer(shape: tuple) -> np.ndarray:
+    """Get this thread's reusable decode buffer, reallocating only on shape change"""
+    buffer = getattr(_decode_buffers, 'buffer', None)
+    if buffer is None or buffer.shape != shape:
+        buffer = np.empty(shape, dtype=np.uint8)
+        _decode_buffers.buffer = buffer
+    return buffer
+
+
+def decode_frame_for_detection(contents: bytes) -> Tuple[Optional[np.ndarray], float]:
+    """Decode an uploaded frame to a downscaled RGB image for face detection
+    
+    JPEGs are decoded by libjpeg-turbo at a native IDCT scale straight into
+    a per-thread scratch buffer, so no full-resolution image, resize or
+    colour conversion is needed; the returned image is only valid until the
+    next call on the same thread. Anything TurboJPEG can't handle goes
+    through cv2.imdecode and cv2.resize. With USE_GPU_JPEG the hardware
+    decoder is tried first.
+    
+    Returns the image and the scale it was decoded at.
+    """
+    if gpu_decoder is not None:
+        try:
+            image = gpu_decoder.decode(contents)
+            if image is not None:
+                # Detection and encoding run on the CPU, so copy the RGB
+                # image back to host memory before downscaling
+                rgb = np.asarray(image.cpu())
+                rgb_small = cv2.resize(rgb, (0, 0), fx=config.FACE_DETECTION_SCALE,
+                                       fy=config.FACE_DETECTION_SCALE)
+                return rgb_small, config.FACE_DETECTION_SCALE
+        except Exception as e:
+            logger.debug(f"GPU decode failed, falling back to CPU: {e}")
+    
+    if jpeg is not None:
+        try:
+            width, height, _, _ = jpeg.decode_header(contents)
+            num, denom = jpeg_scaling_factor
+            shape = ((height * num + denom - 1) // denom,
+                     (width * num + denom - 1) // denom, 3)
+            rgb_small = jpeg.decode(contents, pixel_format=TJPF_RGB,
+                                    scaling_factor=jpeg_scaling_factor,
+                                    dst=_get_decode_buffer(shape))
+            return rgb_small, num / denom
+        except Exception:
+            pass  # Not a JPEG (e.g. PNG upload)
+    
+    img = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None, config.FACE_DETECTION_SCALE
+    
+    small = cv2.resize(img, (0, 0), fx=config.FACE_DETECTION_SCALE, 
+                      fy=config.FACE_DETECTION_SCALE)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2RGB), config.FACE_DETECTION_SCALE
 
 
 # ==================== API Endpoints ====================
 
+def load_template(path: str) -> Tuple[bytes, str]:
+    """Read an HTML page once and compute its ETag"""
+    with open(path, "rb") as f:
+        content = f.read()
+    return content, f'"{hashlib.sha1(content).hexdigest()}"'
+
+
+# Pages are read once at import and served from memory
+INDEX_HTML, INDEX_ETAG = load_template("templates/index.html")
+CAMERA_HTML, CAMERA_ETAG = load_template("templates/camera_direct.html")
+
+
+def html_page_response(request: Request, content: bytes, etag: str) -> Response:
+    """Serve a cached HTML page, answering revalidations with 304"""
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=content, headers=headers)
+
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Root endpoint - serves the web interface"""
-    with open("templates/index.html", "r", encoding="utf-8") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content)
+    return html_page_response(request, INDEX_HTML, INDEX_ETAG)
 
 
 @app.get("/camera")
-async def camera_direct():
+async def camera_direct(request: Request):
     """Direct camera access page"""
-    with open("templates/camera_direct.html", "r", encoding="utf-8") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content)
+    return html_page_response(request, CAMERA_HTML, CAMERA_ETAG)
+
+
+def process_frame_sync(contents: bytes, device_id: str, device_type: str) -> dict:
+    """Run the detection pipeline for an uploaded frame
+    
+    Decoding, face detection and matching are all blocking, so this runs
+    on the detection executor rather than the event loop. Database logging
+    is left to detection_writer.
+    """
+    # Decode at reduced resolution for faster processing
+    rgb_small, scale = decode_frame_for_detection(contents)
+    
+    if rgb_small is None:
+        raise HTTPException(status_code=400, detail="Invalid image")
+    
+    # Phones post far faster than the scene changes, so reuse the previous
+    # result for this device when the frame is a near duplicate
+    frame_hash = None
+    if config.FRAME_DEDUP_MAX_DISTANCE > 0:
+        frame_hash = frame_dhash(rgb_small)
+        cached = _last_frame_results.get(device_id)
+        if cached is not None and bin(cached[0] ^ frame_hash).count("1") < config.FRAME_DEDUP_MAX_DISTANCE:
+            return cached[1]
+    
+    result = detect_faces_in_frame(rgb_small, scale, device_id, device_type)
+    
+    if frame_hash is not None:
+        _last_frame_results[device_id] = (frame_hash, result)
+    
+    return result
+
+
+def detect_faces_in_frame(rgb_small: np.ndarray, scale: float,
+                          device_id: str, device_type: str) -> dict:
+    """Detect, encode and match the faces in a decoded frame"""
+    # Detect faces
+    face_locations = find_face_locations(rgb_small)
+    
+    if not face_locations:
+        return {"detections": [], "message": "No faces detected"}
+    
+    # Get face encodings
+    face_encodings = face_recognition.face_encodings(rgb_small, face_locations)
+    
+    # Report locations at FACE_DETECTION_SCALE even if the decoder snapped
+    # to a different native scale
+    if scale != config.FACE_DETECTION_SCALE:
+        ratio = config.FACE_DETECTION_SCALE / scale
+        face_locations = [tuple(int(v * ratio) for v in loc) for loc in face_locations]
+    
+    # Match all faces against the known gallery in one batched pass
+    matches = detection_engine.match_faces(face_encodings)
+    
+    detections = [
+        {
+            'name': name,
+            'confidence': 1.0 - distance,
+            'device_id': device_id,
+            'device_type': device_type
+        }
+        for name, distance in matches
+        if name != "Unknown"
+    ]
+    
+    return {
+        "detections": detections,
+        "face_locations": face_locations,
+        "total_faces": len(face_locations),
+        "message": f"Detected {len(detections)} known faces"
+    }
+
+
+def get_device_camera_id(device_id: str, device_type: str) -> int:
+    """Get the id of the virtual camera for a device, creating it if needed"""
+    camera_id = device_camera_ids.get(device_id)
+    if camera_id is None:
+        camera_id = db.get_or_create_device_camera(device_id, device_type)
+        device_camera_ids[device_id] = camera_id
+    return camera_id
+
+
+def write_device_detections(detections: List[dict]):
+    """Log a batch of device detections, and any watchlist alerts, to the database"""
+    camera_ids = {}
+    for detection in detections:
+        if detection['device_id'] not in camera_ids:
+            camera_ids[detection['device_id']] = get_device_camera_id(
+                detection['device_id'], detection['device_type']
+            )
+    
+    # All detections go in with a single commit
+    db.add_detections([
+        (camera_ids[d['device_id']], d['name'], d['confidence'], None, None)
+        for d in detections
+    ])
+    
+    # Check watchlist
+    for detection in detections:
+        watchlist_entry = db.is_on_watchlist(detection['name'])
+        if watchlist_entry:
+            db.add_alert(
+                camera_ids[detection['device_id']], 
+                detection['name'], 
+                watchlist_entry['threat_level'],
+                notes=f"Detected on {detection['device_type']}"
+            )
+
+
+async def detection_writer():
+    """Persist queued device detections in batches
+    
+    Waits for a detection, then collects up to DB_WRITE_BATCH_SIZE more
+    for at most DB_WRITE_BATCH_WINDOW seconds and writes them together.
+    """
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        batch = [await detection_queue.get()]
+        deadline = loop.time() + config.DB_WRITE_BATCH_WINDOW
+        
+        while len(batch) < config.DB_WRITE_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(detection_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            await asyncio.to_thread(write_device_detections, batch)
+        except Exception as e:
+            logger.error(f"Error writing detections: {e}")
 
 
 @app.post("/api/detect-frame")
@@ -120,95 +407,24 @@ async def detect_frame(
     try:
         # Read image from upload
         contents = await frame.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image")
-        
-        # Resize for faster processing
-        small = cv2.resize(img, (0, 0), fx=config.FACE_DETECTION_SCALE, 
-                          fy=config.FACE_DETECTION_SCALE)
-        rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-        
-        # Detect faces
-        face_locations = face_recognition.face_locations(rgb_small, 
-                                                        model=config.FACE_DETECTION_MODEL)
-        
-        if not face_locations:
-            return {"detections": [], "message": "No faces detected"}
-        
-        # Get face encodings
-        face_encodings = face_recognition.face_encodings(rgb_small, face_locations)
         
-        # Load known encodings
-        known_encodings = detection_engine.known_encodings
-        known_names = detection_engine.known_names
-        
-        detections = []
+        # Keep the event loop free while the frame is processed
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            detect_executor, process_frame_sync, contents, device_id, device_type
+        )
         
-        for face_encoding in face_encodings:
-            name = "Unknown"
-            confidence = 0.0
-            
-            if len(known_encodings) > 0:
-                matches = face_recognition.compare_faces(
-                    known_encodings, 
-                    face_encoding, 
-                    config.FACE_RECOGNITION_TOLERANCE
-                )
-                
-                face_distances = face_recognition.face_distance(
-                    known_encodings, 
-                    face_encoding
-                )
-                
-                if len(face_distances) > 0:
-                    best_match_index = np.argmin(face_distances)
-                    
-                    if matches[best_match_index]:
-                        name = known_names[best_match_index]
-                        confidence = 1.0 - face_distances[best_match_index]
-            
-            if name != "Unknown":
-                detections.append({
-                    'name': name,
-                    'confidence': float(confidence),
-                    'device_id': device_id,
-                    'device_type': device_type
-                })
-                
-                # Log to database (create a virtual camera for device)
-                camera = db.get_camera_by_name(f"Device_{device_id}")
-                if not camera:
-                    camera_id = db.add_camera(
-                        name=f"Device_{device_id}",
-                        stream_url=f"device://{device_id}",
-                        location=device_type
-                    )
-                else:
-                    camera_id = camera['id']
-                
-                # Add detection
-                db.add_detection(camera_id, name, confidence)
-                
-                # Check watchlist
-                watchlist_entry = db.is_on_watchlist(name)
-                if watchlist_entry:
-                    db.add_alert(
-                        camera_id, 
-                        name, 
-                        watchlist_entry['threat_level'],
-                        notes=f"Detected on {device_type}"
-                    )
+        # Hand detections to the batch writer instead of writing them here
+        for detection in result["detections"]:
+            try:
+                detection_queue.put_nowait(detection)
+            except asyncio.QueueFull:
+                logger.warning("Detection queue full, dropping detection")
         
-        return {
-            "detections": detections,
-            "face_locations": face_locations,
-            "total_faces": len(face_locations),
-            "message": f"Detected {len(detections)} known faces"
-        }
+        return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing frame: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -219,7 +435,7 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(),
         "detection_engine_running": detection_engine.is_running,
         "active_cameras": len([c for c in camera_manager.get_all_cameras().values() if c.is_running])
     }
@@ -314,6 +530,11 @@ async def delete_camera(camera_id: int):
         # Remove from camera manager
         camera_manager.remove_camera(camera_id)
         
+        # Forget it if it was a device's virtual camera
+        for device_id, device_camera_id in list(device_camera_ids.items()):
+            if device_camera_id == camera_id:
+                del device_camera_ids[device_id]
+        
         # Delete from database
         db.delete_camera(camera_id)
         
@@ -381,28 +602,56 @@ async def stop_all_cameras():
 
 # ==================== Video Stream Endpoints ====================
 
-def generate_frames(camera_id: int):
-    """Generate video frames for streaming"""
+def _make_no_signal_jpeg() -> bytes:
+    """Encode the placeholder frame streamed while a camera has no frame"""
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(blank, "No Signal", (200, 240), 
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    ret, buffer = cv2.imencode('.jpg', blank, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return buffer.tobytes()
+
+
+NO_SIGNAL_JPEG = _make_no_signal_jpeg()
+
+
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+
+async def generate_frames(camera_id: int):
+    """Generate video frames for streaming
+    
+    Frames are JPEG-encoded once by the camera manager and the same bytes
+    are shared by every viewer of the camera. Each viewer gets at most one
+    frame per DEFAULT_CAMERA_FPS interval, always the newest; frames that
+    are superseded before their slot are never sent.
+    """
+    loop = asyncio.get_running_loop()
+    frame_interval = 1.0 / config.DEFAULT_CAMERA_FPS
+    last_seq = None
+    next_send = 0.0
+    
     while True:
         try:
-            frame = camera_manager.get_frame(camera_id)
+            frame_bytes, seq = await camera_manager.aget_encoded_frame(camera_id, last_seq)
             
-            if frame is None:
+            if seq == last_seq:
+                # No new frame yet
+                await asyncio.sleep(frame_interval)
+                continue
+            if frame_bytes is None:
                 # Send a blank frame if no frame available
-                blank = np.zeros((480, 640, 3), dtype=np.uint8)
-                cv2.putText(blank, "No Signal", (200, 240), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                frame = blank
+                frame_bytes = NO_SIGNAL_JPEG
+                seq = None
             
-            # Encode frame as JPEG
-            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            if not ret:
+            # Pace sends; re-fetch after waiting so the newest frame goes out
+            now = loop.time()
+            if now < next_send:
+                await asyncio.sleep(next_send - now)
                 continue
+            next_send = now + frame_interval
+            last_seq = seq
             
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            yield b''.join((MJPEG_PART_HEADER, frame_bytes, b'\r\n'))
             
         except Exception as e:
             logger.error(f"Error generating frame: {e}")
@@ -569,34 +818,44 @@ async def reload_known_faces():
 
 # ==================== WebSocket Endpoints ====================
 
+def collect_updates() -> str:
+    """Build and serialize the periodic statistics + alerts update pushed to WebSocket clients"""
+    return encode_message({
+        "type": "update",
+        "data": {
+            "database": db.get_statistics(),
+            "detection_engine": detection_engine.get_statistics(),
+            "cameras": camera_manager.get_all_statuses()
+        },
+        "alerts": db.get_recent_alerts(limit=5, unacknowledged_only=True),
+        "timestamp": datetime.now()
+    })
+
+
+async def broadcast_updates():
+    """Push one combined update to every WebSocket client every 2 seconds"""
+    while True:
+        try:
+            if manager.active_connections:
+                # Gathered and serialized once per tick (off the event loop),
+                # then the same text is sent to every client
+                payload = await asyncio.to_thread(collect_updates)
+                manager.broadcast_payload(payload)
+        except Exception as e:
+            logger.error(f"Error broadcasting updates: {e}")
+        
+        await asyncio.sleep(2)  # Update every 2 seconds
+
+
 @app.websocket("/ws/updates")
 async def websocket_updates(websocket: WebSocket):
     """WebSocket for real-time updates"""
     await manager.connect(websocket)
     try:
+        # Updates are pushed by broadcast_updates; this just waits for the
+        # client to go away
         while True:
-            # Send periodic updates
-            stats = {
-                "type": "statistics",
-                "data": {
-                    "database": db.get_statistics(),
-                    "detection_engine": detection_engine.get_statistics(),
-                    "cameras": camera_manager.get_all_statuses()
-                },
-                "timestamp": datetime.now().isoformat()
-            }
-            await websocket.send_json(stats)
-            
-            # Check for new alerts
-            alerts = db.get_recent_alerts(limit=5, unacknowledged_only=True)
-            if alerts:
-                await websocket.send_json({
-                    "type": "alerts",
-                    "data": alerts,
-                    "timestamp": datetime.now().isoformat()
-                })
-            
-            await asyncio.sleep(2)  # Update every 2 seconds
+            await websocket.receive_text()
             
     except WebSocketDisconnect:
         manager.disconnect(websocket)
@@ -618,6 +877,12 @@ async def startup_event():
     # Start detection engine
     detection_engine.start()
     
+    # Start pushing WebSocket updates and writing device detections
+    global updates_task, writer_task, detection_queue
+    updates_task = asyncio.create_task(broadcast_updates())
+    detection_queue = asyncio.Queue(maxsize=10_000)
+    writer_task = asyncio.create_task(detection_writer())
+    
     logger.info("System started successfully")
 
 
@@ -626,20 +891,39 @@ async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down Multi-Camera CCTV System...")
     
+    # Stop pushing WebSocket updates
+    if updates_task is not None:
+        updates_task.cancel()
+    
     # Stop all cameras
     camera_manager.stop_all_cameras()
     
     # Stop detection engine
     detection_engine.stop()
     
+    # Let in-flight frame uploads finish
+    detect_executor.shutdown(wait=True)
+    
+    # Stop the detection writer and flush whatever it hadn't written yet
+    if writer_task is not None:
+        writer_task.cancel()
+    pending = []
+    while detection_queue is not None and not detection_queue.empty():
+        pending.append(detection_queue.get_nowait())
+    if pending:
+        write_device_detections(pending)
+    
     logger.info("System shutdown complete")
 
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
     uvicorn.run(
         app,
         host=config.SERVER_HOST,
         port=config.SERVER_PORT,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "auto",  # No uvloop build on Windows
+        http="httptools",
         log_level="info"
     )
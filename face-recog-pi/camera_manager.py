@@ -1,13 +1,16 @@
 """
 Camera Manager - Handles multiple camera streams with RTSP support
 """
+import os
 import cv2
+import asyncio
 import threading
 import time
-import queue
+from collections import deque
 import numpy as np
-from typing import Dict, Optional
-from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, Mapping, Optional, Tuple
+from types import MappingProxyType
 import logging
 import config
 from database import db
@@ -15,6 +18,119 @@ from database import db
 logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# Read by OpenCV's FFmpeg backend whenever a capture is opened; an options
+# string already in the environment wins
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", config.CAMERA_FFMPEG_OPTIONS)
+
+# Without an OpenCL device the T-API runs on the CPU and UMat only adds an
+# upload and a download per frame, so it is used only when OpenCL is there
+USE_UMAT = config.USE_UMAT and cv2.ocl.haveOpenCL()
+if config.USE_UMAT and not USE_UMAT:
+    logger.info("USE_UMAT is set but OpenCV has no OpenCL device, resizing on the CPU")
+
+# libjpeg-turbo encoder for streamed frames (falls back to cv2.imencode)
+try:
+    from turbojpeg import TurboJPEG
+    jpeg = TurboJPEG()
+except Exception as e:
+    logger.info(f"TurboJPEG unavailable, using OpenCV for frame encoding: {e}")
+    jpeg = None
+
+JPEG_QUALITY = 85
+
+# PyAV (libav) capture backend for network streams
+try:
+    import av
+except Exception as e:
+    logger.info(f"PyAV unavailable, using OpenCV for capture: {e}")
+    av = None
+
+# Set whenever any camera publishes a frame for detection, so the detection
+# engine's collector can sleep until there is work
+frame_event = threading.Event()
+
+# Frames for detection are published as plain tuples rather than dicts:
+# (camera_id, timestamp_ns, frame, small, shared), where shared is the
+# (ring name, slot, generation) small was copied to, or None without a ring. Camera
+# names are looked up through the manager instead of travelling with frames
+
+# Seconds after the last viewer request that every captured frame keeps being
+# decoded; otherwise only frames due for detection are
+VIEWER_IDLE_TIMEOUT = 2.0
+
+
+def encode_jpeg(frame: np.ndarray) -> Optional[bytes]:
+    """Encode a BGR frame as JPEG"""
+    if jpeg is not None:
+        return jpeg.encode(frame, quality=JPEG_QUALITY)
+    
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
+                                               cv2.IMWRITE_JPEG_OPTIMIZE, 0])
+    return buffer.tobytes() if ret else None
+
+
+class SharedFrameRing:
+    """Fixed ring of frame slots in shared memory
+    
+    Frames are addressed by slot index, so another process can attach by
+    name and read them as NumPy views without pickling or copying.
+    
+    The writer never waits for readers, so each slot carries a generation
+    counter ahead of the frame data: odd while the slot is being written,
+    bumped to the next even value once it is complete. A reader holding the
+    generation a frame was published with can tell whether the slot was
+    reused before or while it copied it out.
+    """
+    
+    def __init__(self, shape: Tuple[int, ...], slots: int, name: Optional[str] = None):
+        self.shape = shape
+        self.slots = slots
+        self.frame_size = int(np.prod(shape))
+        self.header_size = slots * 8
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.header_size + self.frame_size * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.generations = np.ndarray((slots,), dtype=np.uint64, buffer=self.shm.buf)
+        if self.owner:
+            self.generations[:] = 0
+        self.write_index = 0
+    
+    @property
+    def name(self) -> str:
+        return self.shm.name
+    
+    def write(self, frame: np.ndarray) -> Tuple[int, int]:
+        """Copy a frame into the next slot and return the slot index and its generation"""
+        slot = self.write_index % self.slots
+        generation = int(self.generations[slot]) + 1
+        self.generations[slot] = generation  # Odd: write in progress
+        self.view(slot)[:] = frame
+        generation += 1
+        self.generations[slot] = generation
+        self.write_index += 1
+        return slot, generation
+    
+    def read(self, slot: int, generation: int, out: np.ndarray) -> bool:
+        """Copy a slot into out, returning False if it no longer holds that generation"""
+        if int(self.generations[slot]) != generation:
+            return False
+        out[:] = self.view(slot)
+        return int(self.generations[slot]) == generation
+    
+    def view(self, slot: int) -> np.ndarray:
+        """Get a frame slot as an array backed by the shared memory"""
+        return np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                          offset=self.header_size + slot * self.frame_size)
+    
+    def close(self):
+        """Detach from the ring, freeing it if this process created it"""
+        self.generations = None  # Release the buffer export before closing
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
 
 class CameraStream:
     """Handles individual camera stream"""
@@ -26,9 +142,17 @@ class CameraStream:
         self.cap = None
         self.is_running = False
         self.thread = None
-        self.frame_queue = queue.Queue(maxsize=config.MAX_QUEUE_SIZE)
-        self.latest_frame = None
+        self.stop_event = threading.Event()  # Wakes retry/reconnect waits when the stream stops
+        self.frame_deque = deque(maxlen=1)  # Single slot: detection only wants the newest frame
+        self.latest_frame = None  # Never modified in place, so shared without copying
+        self.frame_seq = 0  # Incremented every time latest_frame changes
         self.frame_lock = threading.Lock()
+        self.encoded_frame = None  # (frame_seq, JPEG bytes) shared by all viewers
+        self.encode_lock = threading.Lock()
+        self.grab_count = 0  # Frames grabbed, for PROCESS_EVERY_N_FRAMES
+        self.last_view_time = 0.0  # Last time a viewer asked for the latest frame
+        self.last_capture_time = 0.0  # Time of the last successfully grabbed frame
+        self.frame_ring = None  # SharedFrameRing for detection frames, if enabled
         self.fps = 0
         self.frame_count = 0
         self.last_frame_time = time.time()
@@ -38,111 +162,205 @@ class CameraStream:
     def start(self):
         """Start camera stream"""
         if self.is_running:
-            logger.warning(f"Camera {self.name} is already running")
+            logger.warning("Camera %s is already running", self.name)
             return
         
         self.is_running = True
+        self.stop_event.clear()
         self.thread = threading.Thread(target=self._capture_loop, daemon=True)
         self.thread.start()
-        logger.info(f"Started camera stream: {self.name}")
+        logger.info("Started camera stream: %s", self.name)
     
     def stop(self):
         """Stop camera stream"""
         self.is_running = False
+        self.stop_event.set()
         if self.thread:
             self.thread.join(timeout=2)
         if self.cap:
             self.cap.release()
-        logger.info(f"Stopped camera stream: {self.name}")
+        if self.frame_ring:
+            self.frame_ring.close()
+            self.frame_ring = None
+        logger.info("Stopped camera stream: %s", self.name)
         db.update_camera_status(self.camera_id, "inactive")
     
     def _capture_loop(self):
         """Main capture loop"""
+        if config.CAMERA_BACKEND == "pyav" and av is not None and not self.stream_url.isdigit():
+            self._capture_loop_av()
+            return
+        
         while self.is_running:
             try:
                 # Open camera if not already open
                 if self.cap is None or not self.cap.isOpened():
                     self._connect()
                     if self.cap is None:
-                        time.sleep(config.CAMERA_RECONNECT_DELAY)
+                        self.stop_event.wait(config.CAMERA_RECONNECT_DELAY)
                         continue
                 
-                ret, frame = self.cap.read()
+                # grab() only demuxes; frames are decoded with retrieve() only
+                # when detection or a live viewer actually needs them
+                ret = self.cap.grab()
                 
                 if not ret:
-                    logger.warning(f"Failed to read frame from {self.name}")
+                    logger.warning("Failed to read frame from %s", self.name)
                     self.error_count += 1
                     self.last_error = "Failed to read frame"
                     
                     if self.error_count > 10:
-                        logger.error(f"Too many errors for {self.name}, reconnecting...")
+                        logger.error("Too many errors for %s, reconnecting...", self.name)
                         self._reconnect()
-                    time.sleep(0.1)
+                    else:
+                        # Exponential backoff: transient blips retry almost at
+                        # once, a dead stream still reaches the reconnect in ~2s
+                        self.stop_event.wait(min(0.01 * 2 ** self.error_count, 0.25))
                     continue
                 
-                # Reset error count on successful read
-                self.error_count = 0
-                self.frame_count += 1
-                
-                # Calculate FPS
-                current_time = time.time()
-                if current_time - self.last_frame_time >= 1.0:
-                    self.fps = self.frame_count / (current_time - self.last_frame_time)
-                    self.frame_count = 0
-                    self.last_frame_time = current_time
-                
-                # Store latest frame
-                with self.frame_lock:
-                    self.latest_frame = frame.copy()
+                self._handle_frame(self._retrieve)
                 
-                # Add to processing queue (non-blocking)
-                try:
-                    self.frame_queue.put_nowait({
-                        'frame': frame,
-                        'timestamp': datetime.now(),
-                        'camera_id': self.camera_id,
-                        'camera_name': self.name
-                    })
-                except queue.Full:
-                    # Skip frame if queue is full
-                    pass
-                
-                # Update camera status
+            except Exception as e:
+                logger.error("Error in capture loop for %s: %s", self.name, e)
+                self.last_error = str(e)
+                self.error_count += 1
+                self.stop_event.wait(1)
+    
+    def _capture_loop_av(self):
+        """Capture loop using PyAV
+        
+        libav demuxes and decodes with the GIL released, so several cameras
+        decode in parallel with the recognition workers.
+        """
+        options = dict(opt.split(";", 1) for opt in config.CAMERA_FFMPEG_OPTIONS.split("|"))
+        
+        while self.is_running:
+            container = None
+            try:
+                logger.info("Connecting to %s at %s (PyAV)", self.name, self.stream_url)
+                container = av.open(self.stream_url, options=options,
+                                    timeout=config.CAMERA_TIMEOUT)
+                stream = container.streams.video[0]
+                stream.thread_type = "AUTO"
+                logger.info("Successfully connected to %s", self.name)
                 db.update_camera_status(self.camera_id, "active")
+                self.error_count = 0
+                
+                for av_frame in container.decode(stream):
+                    if not self.is_running:
+                        break
+                    # Conversion to BGR is the PyAV counterpart of retrieve()
+                    self._handle_frame(lambda: av_frame.to_ndarray(format="bgr24"))
                 
             except Exception as e:
-                logger.error(f"Error in capture loop for {self.name}: {e}")
+                logger.error("Error in PyAV capture for %s: %s", self.name, e)
                 self.last_error = str(e)
                 self.error_count += 1
-                time.sleep(1)
+                db.update_camera_status(self.camera_id, "error")
+            finally:
+                if container is not None:
+                    container.close()
+            
+            if self.is_running:
+                self.stop_event.wait(config.CAMERA_RECONNECT_DELAY)
+    
+    def _retrieve(self) -> Optional[np.ndarray]:
+        """Decode the last grabbed frame"""
+        ret, frame = self.cap.retrieve()
+        return frame if ret else None
+    
+    def _handle_frame(self, retrieve):
+        """Account for a captured frame and publish it if anyone needs it
+        
+        retrieve is only called (to decode/convert the frame) when the frame
+        is due for detection or a viewer is watching.
+        """
+        # Reset error count on successful read
+        self.error_count = 0
+        self.frame_count += 1
+        
+        # Calculate FPS
+        current_time = time.time()
+        if current_time - self.last_frame_time >= 1.0:
+            self.fps = self.frame_count / (current_time - self.last_frame_time)
+            self.frame_count = 0
+            self.last_frame_time = current_time
+        
+        self.grab_count += 1
+        process = self.grab_count % config.PROCESS_EVERY_N_FRAMES == 0
+        viewed = current_time - self.last_view_time < VIEWER_IDLE_TIMEOUT
+        
+        if process or viewed:
+            frame = retrieve()
+            if frame is not None:
+                # Publish latest frame; both backends hand back a fresh array
+                # each time, so the reference can be shared as is. Freezing it
+                # turns an accidental in-place edit by a reader into an error
+                frame.flags.writeable = False
+                with self.frame_lock:
+                    self.latest_frame = frame
+                    self.frame_seq += 1
+                
+                # Replace any frame still waiting for detection, downscaled
+                # here once so the detection workers don't have to
+                if process:
+                    # With USE_UMAT the resize goes through OpenCV's T-API on OpenCL
+                    source = cv2.UMat(frame) if USE_UMAT else frame
+                    small = cv2.resize(source, (0, 0), fx=config.FACE_DETECTION_SCALE,
+                                       fy=config.FACE_DETECTION_SCALE,
+                                       interpolation=cv2.INTER_AREA)
+                    if USE_UMAT:
+                        small = small.get()
+                    shared = self._publish_shared(small) if config.USE_SHARED_FRAME_RING else None
+                    # Timestamp is converted to datetime only if needed
+                    frame_data = (self.camera_id, time.time_ns(), frame, small, shared)
+                    self.frame_deque.append(frame_data)  # Evicts any stale frame
+                    frame_event.set()
+        
+        # The manager's heartbeat thread reports the camera as active from this
+        self.last_capture_time = current_time
+    
+    def _publish_shared(self, frame: np.ndarray) -> Tuple[str, int, int]:
+        """Copy a downscaled frame into this camera's shared-memory ring
+        
+        Returns the ring name, slot and slot generation so worker processes
+        can read it in place and detect if it was overwritten meanwhile.
+        """
+        if self.frame_ring is None or self.frame_ring.shape != frame.shape:
+            if self.frame_ring is not None:
+                self.frame_ring.close()
+            self.frame_ring = SharedFrameRing(frame.shape, config.SHARED_FRAME_RING_SLOTS)
+        return (self.frame_ring.name, *self.frame_ring.write(frame))
     
     def _connect(self):
         """Connect to camera stream"""
         try:
-            logger.info(f"Connecting to {self.name} at {self.stream_url}")
+            logger.info("Connecting to %s at %s", self.name, self.stream_url)
             
             # Try to parse stream URL as integer for webcam index
             try:
                 source = int(self.stream_url)
+                self.cap = cv2.VideoCapture(source)
             except ValueError:
-                source = self.stream_url
-            
-            self.cap = cv2.VideoCapture(source)
+                # Network streams always go through FFmpeg so the low-latency
+                # capture options apply
+                self.cap = cv2.VideoCapture(self.stream_url, cv2.CAP_FFMPEG)
             
             # Set buffer size to reduce latency
             self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self.cap.set(cv2.CAP_PROP_FPS, config.DEFAULT_CAMERA_FPS)
             
             if self.cap.isOpened():
-                logger.info(f"Successfully connected to {self.name}")
+                logger.info("Successfully connected to %s", self.name)
                 db.update_camera_status(self.camera_id, "active")
                 self.error_count = 0
             else:
-                logger.error(f"Failed to open camera {self.name}")
+                logger.error("Failed to open camera %s", self.name)
                 self.cap = None
                 db.update_camera_status(self.camera_id, "error")
                 
         except Exception as e:
-            logger.error(f"Error connecting to {self.name}: {e}")
+            logger.error("Error connecting to %s: %s", self.name, e)
             self.cap = None
             self.last_error = str(e)
             db.update_camera_status(self.camera_id, "error")
@@ -153,12 +371,33 @@ class CameraStream:
             self.cap.release()
         self.cap = None
         self.error_count = 0
-        time.sleep(config.CAMERA_RECONNECT_DELAY)
+        self.stop_event.wait(config.CAMERA_RECONNECT_DELAY)
     
     def get_latest_frame(self) -> Optional[np.ndarray]:
-        """Get the latest frame"""
+        """Get the latest frame (shared and read-only; copy it to modify)"""
+        self.last_view_time = time.time()
         with self.frame_lock:
-            return self.latest_frame.copy() if self.latest_frame is not None else None
+            return self.latest_frame
+    
+    def get_encoded_frame(self) -> Tuple[Optional[bytes], int]:
+        """Get the latest frame as JPEG, encoding each new frame only once
+        
+        Returns the JPEG bytes (None if there's no frame yet) and the frame's
+        sequence number, so streamers can tell when a new frame is available.
+        """
+        self.last_view_time = time.time()
+        with self.encode_lock:
+            with self.frame_lock:
+                frame = self.latest_frame
+                seq = self.frame_seq
+            
+            if frame is None:
+                return None, seq
+            
+            if self.encoded_frame is None or self.encoded_frame[0] != seq:
+                self.encoded_frame = (seq, encode_jpeg(frame))
+            
+            return self.encoded_frame[1], seq
     
     def get_status(self) -> Dict:
         """Get camera status"""
@@ -168,7 +407,7 @@ class CameraStream:
             'stream_url': self.stream_url,
             'is_running': self.is_running,
             'fps': round(self.fps, 2),
-            'queue_size': self.frame_queue.qsize(),
+            'queue_size': len(self.frame_deque),
             'error_count': self.error_count,
             'last_error': self.last_error
         }
@@ -178,8 +417,12 @@ class CameraManager:
     """Manages multiple camera streams"""
     
     def __init__(self):
+        # Replaced (copy-on-write) rather than mutated, so readers can iterate
+        # a snapshot without locking
         self.cameras: Dict[int, CameraStream] = {}
+        self.cameras_view = MappingProxyType(self.cameras)
         self.lock = threading.Lock()
+        self.heartbeat_thread = None  # Writes "active" statuses for all cameras in one batch
         logger.info("Camera Manager initialized")
     
     def add_camera(self, camera_id: int, name: str, stream_url: str) -> bool:
@@ -190,10 +433,17 @@ class CameraManager:
                 return False
             
             camera = CameraStream(camera_id, name, stream_url)
-            self.cameras[camera_id] = camera
+            cameras = dict(self.cameras)
+            cameras[camera_id] = camera
+            self._set_cameras(cameras)
             logger.info(f"Added camera: {name} (ID: {camera_id})")
             return True
     
+    def _set_cameras(self, cameras: Dict[int, CameraStream]):
+        """Publish a new cameras dict and its read-only view (call with lock held)"""
+        self.cameras = cameras
+        self.cameras_view = MappingProxyType(cameras)
+    
     def remove_camera(self, camera_id: int) -> bool:
         """Remove a camera"""
         with self.lock:
@@ -203,7 +453,9 @@ class CameraManager:
             
             camera = self.cameras[camera_id]
             camera.stop()
-            del self.cameras[camera_id]
+            cameras = dict(self.cameras)
+            del cameras[camera_id]
+            self._set_cameras(cameras)
             logger.info(f"Removed camera: {camera.name} (ID: {camera_id})")
             return True
     
@@ -215,6 +467,7 @@ class CameraManager:
                 return False
             
             self.cameras[camera_id].start()
+            self._ensure_heartbeat()
             return True
     
     def stop_camera(self, camera_id: int) -> bool:
@@ -233,6 +486,7 @@ class CameraManager:
             for camera in self.cameras.values():
                 if not camera.is_running:
                     camera.start()
+            self._ensure_heartbeat()
         logger.info("Started all cameras")
     
     def stop_all_cameras(self):
@@ -242,13 +496,37 @@ class CameraManager:
                 camera.stop()
         logger.info("Stopped all cameras")
     
+    def _ensure_heartbeat(self):
+        """Start the status heartbeat thread if it isn't running (call with lock held)"""
+        if self.heartbeat_thread is None:
+            self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self.heartbeat_thread.start()
+    
+    def _heartbeat_loop(self):
+        """Mark every camera that delivered a frame recently as active, in one transaction"""
+        while True:
+            time.sleep(config.CAMERA_STATUS_INTERVAL)
+            try:
+                cutoff = time.time() - config.CAMERA_STATUS_INTERVAL
+                active = [camera.camera_id for camera in self.cameras_view.values()
+                          if camera.is_running and camera.last_capture_time >= cutoff]
+                if active:
+                    db.update_camera_statuses([("active", camera_id) for camera_id in active])
+            except Exception as e:
+                logger.error(f"Error writing camera heartbeats: {e}")
+    
     def get_camera(self, camera_id: int) -> Optional[CameraStream]:
         """Get a specific camera"""
         return self.cameras.get(camera_id)
     
-    def get_all_cameras(self) -> Dict[int, CameraStream]:
-        """Get all cameras"""
-        return self.cameras.copy()
+    def get_camera_name(self, camera_id: int) -> str:
+        """Get a camera's display name, falling back to its id once removed"""
+        camera = self.cameras.get(camera_id)
+        return camera.name if camera is not None else f"camera_{camera_id}"
+    
+    def get_all_cameras(self) -> Mapping[int, CameraStream]:
+        """Get a read-only view of all cameras (use dict() for a mutable copy)"""
+        return self.cameras_view
     
     def get_frame(self, camera_id: int) -> Optional[np.ndarray]:
         """Get latest frame from a camera"""
@@ -257,16 +535,50 @@ class CameraManager:
             return camera.get_latest_frame()
         return None
     
+    def get_encoded_frame(self, camera_id: int) -> Tuple[Optional[bytes], int]:
+        """Get latest frame from a camera as shared JPEG bytes plus its sequence number"""
+        camera = self.cameras.get(camera_id)
+        if camera:
+            return camera.get_encoded_frame()
+        return None, -1
+    
+    async def aget_encoded_frame(self, camera_id: int, last_seq: Optional[int] = None) -> Tuple[Optional[bytes], int]:
+        """Async get_encoded_frame; only a frame that still needs encoding goes to a worker thread
+        
+        Viewers poll at the stream rate, so the common cases are answered on
+        the event loop: no frame yet, the viewer's last_seq unchanged (bytes
+        are None then) or a frame another viewer has already encoded.
+        """
+        camera = self.cameras.get(camera_id)
+        if camera is None:
+            return None, -1
+        
+        camera.last_view_time = time.time()
+        seq = camera.frame_seq
+        if seq == last_seq or camera.latest_frame is None:
+            return None, seq
+        encoded = camera.encoded_frame
+        if encoded is not None and encoded[0] == seq:
+            return encoded[1], seq
+        return await asyncio.to_thread(camera.get_encoded_frame)
+    
     def get_all_statuses(self) -> list:
         """Get status of all cameras"""
         return [camera.get_status() for camera in self.cameras.values()]
     
     def load_cameras_from_db(self):
         """Load all cameras from database"""
-        cameras = db.get_all_cameras()
-        for cam in cameras:
-            self.add_camera(cam['id'], cam['name'], cam['stream_url'])
-        logger.info(f"Loaded {len(cameras)} cameras from database")
+        rows = db.get_all_cameras()
+        
+        # Publish all cameras at once, so no partially loaded set is visible
+        with self.lock:
+            cameras = dict(self.cameras)
+            for cam in rows:
+                if cam['id'] not in cameras:
+                    cameras[cam['id']] = CameraStream(cam['id'], cam['name'], cam['stream_url'])
+            self._set_cameras(cameras)
+        
+        logger.info(f"Loaded {len(rows)} cameras from database")
 
 
 # Global camera manager instance
@@ -10,27 +10,55 @@ DEBUG_MODE = True
 
 # Database Configuration
 DATABASE_FILE = "cctv_system.db"
+DB_POOL_SIZE = 8  # SQLite connections shared by all threads
+DB_WRITE_BATCH_SIZE = 256  # Maximum detections written per transaction
+DB_WRITE_BATCH_WINDOW = 0.25  # Seconds to collect detections before writing a batch
 
 # Face Recognition Configuration
 KNOWN_ENCODINGS_FILE = "known_encodings.npy"
-FACE_DETECTION_MODEL = "hog"  # "hog" or "cnn"
+FACE_DETECTION_MODEL = "hog"  # "hog", "cnn" or "yunet" (OpenCV DNN, much faster on ARM)
+YUNET_MODEL_FILE = "face_detection_yunet_2023mar.onnx"  # From the opencv_zoo repository
+YUNET_SCORE_THRESHOLD = 0.6
 FACE_RECOGNITION_TOLERANCE = 0.5
 FACE_DETECTION_SCALE = 0.5  # Scale factor for faster processing
+FACE_MATCH_BACKEND = "numpy"  # "numpy", "cosine", "numba" (float32 gallery only), "simsimd", "int8", "faiss" or "hnsw"; optional backends need their package installed
+FACE_MATCH_FP16 = False  # Keep the known-face gallery in float16 (half the memory); pair with "simsimd" for native FP16 kernels, NumPy matmul is slower
+INT8_RERANK_TOP_K = 8  # Candidates per face the int8 backend re-checks with exact float32 distances
+FAISS_IVF_THRESHOLD = 5000  # Gallery size at which the FAISS backend switches from exact to IVF search
+FAISS_IVF_FACTORY = "IVF256,Flat"
+FAISS_NPROBE = 16  # IVF lists scanned per query
+FAISS_INDEX_FILE = "known_faces.faiss"  # Trained IVF index cache
+HNSW_M = 16  # Graph links per node for the hnsw backend
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64  # Candidate list size per query; higher is more accurate and slower
 
 # Video Processing Configuration
 PROCESS_EVERY_N_FRAMES = 2  # Process every Nth frame for performance
-MAX_QUEUE_SIZE = 100  # Maximum frames in processing queue per camera
 FRAME_BUFFER_SIZE = 30  # Number of frames to keep in memory for streaming
+SHARED_FRAME_RING_SLOTS = 0  # Per-camera shared-memory slots handing downscaled frames to DETECT_PROCESSES (0 pickles them instead)
+DETECT_PROCESSES = 0  # Run camera face detection in this many worker processes instead of threads (0 keeps threads)
+DETECT_TASK_TIMEOUT = 30  # Seconds a frame may wait on a detection process before it is given up as lost
+USE_SHARED_FRAME_RING = SHARED_FRAME_RING_SLOTS > 0 and DETECT_PROCESSES > 0  # Detection threads read frames directly, so the ring only serves processes
+USE_UMAT = os.environ.get("CCTV_USE_UMAT") == "1"  # Downscale captured frames via cv2.UMat; only used if OpenCV also finds an OpenCL device
+DETECT_WORKERS = max(2, (os.cpu_count() or 4) // 2)  # Threads serving /api/detect-frame uploads; half the cores leaves room for camera detection (2 on a Pi 4)
+USE_GPU_JPEG = False  # Decode uploaded JPEGs with nvImageCodec (Jetson/NVIDIA GPUs)
+FRAME_DEDUP_MAX_DISTANCE = 6  # Reuse the last result when a device frame's dHash differs by fewer bits (0 disables)
+LOCATION_REUSE_MAX_DISTANCE = 6  # Reuse a camera's last face locations when its frame dHash differs by fewer bits (0 disables)
 
 # Camera Configuration
 DEFAULT_CAMERA_FPS = 25
 CAMERA_RECONNECT_DELAY = 5  # Seconds to wait before reconnecting
 CAMERA_TIMEOUT = 10  # Seconds before considering camera disconnected
+CAMERA_BACKEND = "opencv"  # "opencv" or "pyav" (network streams only, requires av)
+# FFmpeg capture options for network streams: RTSP over TCP with demuxer buffering disabled
+CAMERA_FFMPEG_OPTIONS = "rtsp_transport;tcp|fflags;nobuffer|flags;low_delay|max_delay;0|reorder_queue_size;0"
+CAMERA_STATUS_INTERVAL = 5  # Seconds between "active" heartbeats written to the database
 
 # Alert Configuration
 ALERT_COOLDOWN = 30  # Seconds between alerts for same person on same camera
 SAVE_ALERT_SNAPSHOTS = True
 ALERT_SNAPSHOT_DIR = "alerts"
+SNAPSHOT_QUEUE_SIZE = 200  # Snapshots waiting to be written before new ones are dropped
 
 # Directories
 STATIC_DIR = "static"
@@ -6,18 +6,113 @@ import numpy as np
 import face_recognition
 import threading
 import queue
+import multiprocessing
 import time
 import os
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 import config
 from database import db
-from camera_manager import camera_manager
+from camera_manager import SharedFrameRing, camera_manager, encode_jpeg, frame_event
+from face_ops import compute_face_encodings, match_all
 
 logging.basicConfig(level=config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
+# Optional SimSIMD distance kernels (NEON/AVX2/AVX-512 dispatch)
+try:
+    import simsimd
+except Exception as e:
+    logger.info(f"SimSIMD unavailable, using NumPy for face matching: {e}")
+    simsimd = None
+
+# Optional FAISS index for large galleries
+try:
+    import faiss
+except Exception as e:
+    logger.info(f"FAISS unavailable, using NumPy for face matching: {e}")
+    faiss = None
+
+# Optional HNSW graph index for large galleries
+try:
+    import hnswlib
+except Exception as e:
+    logger.info(f"hnswlib unavailable, using NumPy for face matching: {e}")
+    hnswlib = None
+
+def frame_dhash(rgb: np.ndarray) -> int:
+    """Compute a 64-bit difference hash of an RGB or grayscale frame"""
+    gray = rgb if rgb.ndim == 2 else cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small[:, 1:] > small[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+# Per-thread YuNet detectors; cv2.FaceDetectorYN instances are not thread-safe
+_yunet_detectors = threading.local()
+
+
+def find_face_locations(rgb: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Locate faces as (top, right, bottom, left) boxes with the configured detector"""
+    if config.FACE_DETECTION_MODEL != "yunet":
+        return face_recognition.face_locations(rgb, model=config.FACE_DETECTION_MODEL)
+    # YuNet was trained on BGR input
+    return _yunet_face_locations(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+
+
+def find_face_locations_bgr(bgr: np.ndarray, gray: Optional[np.ndarray] = None) -> List[Tuple[int, int, int, int]]:
+    """Locate faces in a BGR frame, converting it only as far as the detector needs
+    
+    dlib's HOG detector works on luminance alone, so it gets the grayscale
+    frame; YuNet takes BGR as is and only the CNN model needs RGB.
+    """
+    if config.FACE_DETECTION_MODEL == "yunet":
+        return _yunet_face_locations(bgr)
+    if config.FACE_DETECTION_MODEL == "hog":
+        if gray is None:
+            gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        return face_recognition.face_locations(gray, model="hog")
+    return face_recognition.face_locations(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB),
+                                           model=config.FACE_DETECTION_MODEL)
+
+
+def _yunet_face_locations(bgr: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Locate faces in a BGR frame with this thread's YuNet detector"""
+    detector = getattr(_yunet_detectors, "detector", None)
+    if detector is None:
+        detector = cv2.FaceDetectorYN.create(config.YUNET_MODEL_FILE, "", (320, 320),
+                                             config.YUNET_SCORE_THRESHOLD, 0.3, 5000)
+        _yunet_detectors.detector = detector
+    
+    height, width = bgr.shape[:2]
+    detector.setInputSize((width, height))
+    _, faces = detector.detect(bgr)
+    if faces is None:
+        return []
+    
+    locations = []
+    for x, y, w, h in faces[:, :4]:
+        top = max(int(y), 0)
+        right = min(int(x + w), width)
+        bottom = min(int(y + h), height)
+        left = max(int(x), 0)
+        locations.append((top, right, bottom, left))
+    return locations
+
+
+def quantize_gallery(known_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Quantize a gallery to int8 with one symmetric scale
+    
+    Returns the int8 matrix (4x smaller than float32), its squared norms as
+    int32 and the scale, so ||p - k||^2 can be approximated in integer math.
+    """
+    scale = 127.0 / max(float(np.abs(known_matrix).max()), 1e-6)
+    known_q = np.clip(np.rint(known_matrix.astype(np.float32) * scale), -127, 127).astype(np.int8)
+    known_q_sq_norms = np.einsum('ij,ij->i', known_q, known_q, dtype=np.int32)
+    return known_q, known_q_sq_norms, scale
+
 
 class DetectionEngine:
     """Multi-threaded face detection and recognition engine"""
@@ -25,12 +120,40 @@ class DetectionEngine:
     def __init__(self):
         self.known_encodings = []
         self.known_names = []
+        self.known_matrix = np.empty((0, 128), dtype=np.float32)
+        self.known_sq_norms = np.empty(0, dtype=np.float32)
+        self.known_names_array = np.empty(0, dtype=object)
+        self.known_unit = None  # (L2-normalised gallery, squared mean gallery norm) for the cosine backend
+        self.known_quantized = None  # (int8 gallery, int32 squared norms, scale) for the int8 backend
+        self.known_index = None  # FAISS index over known_matrix, if enabled
+        self.known_hnsw = None  # hnswlib index over known_matrix, if enabled
+        self.known_lock = threading.RLock()  # Guards swapping the gallery on reload
         self.is_running = False
         self.worker_threads = []
         self.num_workers = 4  # Number of processing threads
-        self.processing_queue = queue.Queue(maxsize=500)
-        self.results_queue = queue.Queue()
-        self.alert_cooldown = {}  # Track last alert time per person per camera
+        # SimpleQueue is implemented in C without Queue's condition variables;
+        # processing_queue is bounded by the collector instead
+        self.processing_queue = queue.SimpleQueue()
+        self.results_queue = queue.SimpleQueue()
+        self.max_processing_queue = 500
+        # Process mode (DETECT_PROCESSES > 0): frames in flight are kept here
+        # by task id, with their submit time, and rejoined with the
+        # detections the processes send back
+        self.process_context = None
+        self.worker_processes = []
+        self.task_queue = None
+        self.process_results_queue = None
+        self.gallery_version = None  # Shared counter telling processes to reload the gallery
+        self.pending_frames = {}
+        self.next_task_id = 0
+        self.alert_cooldown: Dict[Tuple[int, int], float] = {}  # (camera_id, name id) -> monotonic time of last alert
+        self.name_ids: Dict[str, int] = {}  # Interned person names; ids stay stable across reloads
+        self.last_locations = {}  # camera_id -> (frame dHash, face locations) for detection reuse
+        self.pending_detections = deque()  # Detection rows waiting for the next batch insert
+        self.flush_event = threading.Event()  # Set when a full batch is waiting
+        self.flusher_thread = None
+        self.snapshot_queue = queue.Queue(maxsize=config.SNAPSHOT_QUEUE_SIZE)  # (path, face crop) to encode and write
+        self.snapshot_thread = None
         self.detection_count = 0
         self.alert_count = 0
         self.load_known_faces()
@@ -45,8 +168,8 @@ class DetectionEngine:
             
             data = np.load(config.KNOWN_ENCODINGS_FILE, allow_pickle=True).item()
             
-            self.known_names = []
-            self.known_encodings = []
+            known_names = []
+            known_encodings = []
             
             for name, val in data.items():
                 if val is None:
@@ -54,22 +177,205 @@ class DetectionEngine:
                 arr = np.array(val)
                 
                 if arr.ndim == 1 and arr.size == 128:
-                    self.known_names.append(name)
-                    self.known_encodings.append(arr)
+                    known_names.append(name)
+                    known_encodings.append(arr)
                 elif arr.ndim == 2 and arr.shape[1] == 128:
                     for row in arr:
-                        self.known_names.append(name)
-                        self.known_encodings.append(row)
+                        known_names.append(name)
+                        known_encodings.append(row)
+            
+            # Cache the gallery as one contiguous matrix for batched matching
+            gallery_dtype = np.float16 if config.FACE_MATCH_FP16 else np.float32
+            if known_encodings:
+                known_matrix = np.ascontiguousarray(np.vstack(known_encodings), dtype=gallery_dtype)
+            else:
+                known_matrix = np.empty((0, 128), dtype=gallery_dtype)
+            known_sq_norms = np.einsum('ij,ij->i', known_matrix, known_matrix, dtype=np.float32)
+            known_names_array = np.array(known_names, dtype=object)
+            
+            known_unit = None
+            if config.FACE_MATCH_BACKEND == "cosine" and len(known_matrix):
+                unit = known_matrix.astype(np.float32)
+                norms = np.linalg.norm(unit, axis=1, keepdims=True)
+                unit /= norms
+                known_unit = (unit, float(norms.mean()) ** 2)
+            
+            known_quantized = None
+            if config.FACE_MATCH_BACKEND == "int8" and len(known_matrix):
+                known_quantized = quantize_gallery(known_matrix)
+            
+            known_index = None
+            if config.FACE_MATCH_BACKEND == "faiss" and faiss is not None and len(known_matrix):
+                known_index = self._build_faiss_index(known_matrix)
+            
+            known_hnsw = None
+            if config.FACE_MATCH_BACKEND == "hnsw" and hnswlib is not None and len(known_matrix):
+                known_hnsw = self._build_hnsw_index(known_matrix)
+            
+            with self.known_lock:
+                for name in known_names:
+                    self.name_ids.setdefault(name, len(self.name_ids))
+                self.known_names = known_names
+                self.known_encodings = known_encodings
+                self.known_matrix = known_matrix
+                self.known_sq_norms = known_sq_norms
+                self.known_names_array = known_names_array
+                self.known_unit = known_unit
+                self.known_quantized = known_quantized
+                self.known_index = known_index
+                self.known_hnsw = known_hnsw
             
             logger.info(f"Loaded {len(set(self.known_names))} people, {len(self.known_encodings)} encodings")
             
         except Exception as e:
             logger.error(f"Error loading known faces: {e}")
     
+    def _build_faiss_index(self, known_matrix: np.ndarray):
+        """Build a FAISS L2 index over the gallery
+        
+        Small galleries use an exact flat index. Past FAISS_IVF_THRESHOLD
+        entries an IVF index is trained instead, and cached in
+        FAISS_INDEX_FILE until the encodings file changes.
+        """
+        gallery = np.ascontiguousarray(known_matrix, dtype=np.float32)
+        
+        if len(gallery) < config.FAISS_IVF_THRESHOLD:
+            index = faiss.IndexFlatL2(gallery.shape[1])
+            index.add(gallery)
+            return index
+        
+        index = None
+        if (os.path.exists(config.FAISS_INDEX_FILE) and
+                os.path.getmtime(config.FAISS_INDEX_FILE) >= os.path.getmtime(config.KNOWN_ENCODINGS_FILE)):
+            try:
+                index = faiss.read_index(config.FAISS_INDEX_FILE)
+                if index.ntotal != len(gallery):
+                    index = None
+            except Exception as e:
+                logger.warning(f"Could not load FAISS index, rebuilding: {e}")
+                index = None
+        
+        if index is None:
+            logger.info(f"Training FAISS IVF index on {len(gallery)} encodings")
+            index = faiss.index_factory(gallery.shape[1], config.FAISS_IVF_FACTORY)
+            index.train(gallery)
+            index.add(gallery)
+            faiss.write_index(index, config.FAISS_INDEX_FILE)
+        
+        faiss.extract_index_ivf(index).nprobe = config.FAISS_NPROBE
+        return index
+    
+    def _build_hnsw_index(self, known_matrix: np.ndarray):
+        """Build an hnswlib L2 graph index over the gallery"""
+        gallery = np.ascontiguousarray(known_matrix, dtype=np.float32)
+        index = hnswlib.Index(space='l2', dim=gallery.shape[1])
+        index.init_index(max_elements=len(gallery), ef_construction=config.HNSW_EF_CONSTRUCTION,
+                         M=config.HNSW_M)
+        index.add_items(gallery, np.arange(len(gallery)))
+        index.set_ef(config.HNSW_EF_SEARCH)
+        return index
+    
     def reload_known_faces(self):
         """Reload known faces (useful after adding new people)"""
         logger.info("Reloading known faces...")
         self.load_known_faces()
+        if self.gallery_version is not None:
+            with self.gallery_version.get_lock():
+                self.gallery_version.value += 1
+    
+    def match_faces(self, face_encodings) -> List[Tuple[str, float]]:
+        """Match face encodings against all known faces in a single batched pass
+        
+        Returns a (name, distance) pair per encoding; unmatched faces are
+        reported as "Unknown" with the distance to the closest known face.
+        """
+        with self.known_lock:
+            known_matrix = self.known_matrix
+            known_sq_norms = self.known_sq_norms
+            known_names_array = self.known_names_array
+            known_unit = self.known_unit
+            known_quantized = self.known_quantized
+            known_index = self.known_index
+            known_hnsw = self.known_hnsw
+        
+        if len(face_encodings) == 0:
+            return []
+        if len(known_matrix) == 0:
+            return [("Unknown", 1.0)] * len(face_encodings)
+        
+        probes = np.asarray(face_encodings, dtype=np.float32)
+        if known_index is not None:
+            sq_dists, indices = known_index.search(np.ascontiguousarray(probes), 1)
+            best = indices[:, 0]
+            # IVF search can come back empty (-1) if the probed lists are empty
+            best_sq_dists = np.where(best >= 0, np.maximum(sq_dists[:, 0], 0.0), np.inf)
+        elif known_hnsw is not None:
+            # hnswlib's l2 space reports squared distances
+            labels, sq_dists = known_hnsw.knn_query(probes, k=1)
+            best = labels[:, 0].astype(np.intp)
+            best_sq_dists = np.maximum(sq_dists[:, 0], 0.0)
+        elif known_unit is not None:
+            # Cosine similarity against the pre-normalised gallery is a single
+            # GEMM. The unit-sphere chord 2 - 2 cos is rescaled by the squared
+            # mean gallery norm: dlib descriptors sit around norm 1.4, not 1,
+            # so unscaled chords would make FACE_RECOGNITION_TOLERANCE looser
+            unit, mean_sq_norm = known_unit
+            probes = probes / np.linalg.norm(probes, axis=1, keepdims=True)
+            sims = probes @ unit.T
+            best = sims.argmax(axis=1)
+            best_sq_dists = np.maximum(2.0 - 2.0 * sims[np.arange(len(probes)), best], 0.0) * mean_sq_norm
+        elif known_quantized is not None:
+            # Coarse search on the int8 gallery narrows each face to its
+            # INT8_RERANK_TOP_K nearest candidates, which are then re-ranked
+            # with exact float32 distances
+            known_q, known_q_sq_norms, scale = known_quantized
+            probes_q = np.clip(np.rint(probes * scale), -127, 127).astype(np.int32)
+            approx_sq = (probes_q ** 2).sum(axis=1)[:, None] + known_q_sq_norms[None, :] \
+                - 2 * (probes_q @ known_q.T)
+            
+            top_k = max(1, min(config.INT8_RERANK_TOP_K, len(known_q)))
+            if top_k < len(known_q):
+                candidates = np.argpartition(approx_sq, top_k - 1, axis=1)[:, :top_k]
+            else:
+                candidates = np.broadcast_to(np.arange(len(known_q)), (len(probes), top_k))
+            diff = known_matrix[candidates].astype(np.float32) - probes[:, None, :]
+            candidate_sq = np.einsum('ijk,ijk->ij', diff, diff)
+            
+            rows = np.arange(len(probes))
+            pick = candidate_sq.argmin(axis=1)
+            best = candidates[rows, pick]
+            best_sq_dists = candidate_sq[rows, pick]
+        elif config.FACE_MATCH_BACKEND == "simsimd" and simsimd is not None:
+            # Probes match the gallery dtype so FP16 galleries use the FP16 kernel
+            sq_dists = np.asarray(simsimd.cdist(probes.astype(known_matrix.dtype), known_matrix,
+                                                metric="sqeuclidean"))
+            best = sq_dists.argmin(axis=1)
+            best_sq_dists = sq_dists[np.arange(len(probes)), best]
+        elif (config.FACE_MATCH_BACKEND == "numba" and match_all is not None
+                and known_matrix.dtype == np.float32):
+            best, best_sq_dists = match_all(np.ascontiguousarray(probes), known_matrix)
+        else:
+            # ||p - k||^2 = ||p||^2 + ||k||^2 - 2 p.k, computed with one GEMM
+            # (GEMV for a single face; an FP16 gallery is promoted to float32
+            # inside the product). ||p||^2 is constant per row so it doesn't
+            # affect the argmin and is only added to the winners, and the
+            # rest is updated in place to avoid (faces, N) temporaries
+            sq_dists = probes @ known_matrix.T
+            sq_dists *= -2.0
+            sq_dists += known_sq_norms
+            
+            best = sq_dists.argmin(axis=1)
+            probe_sq_norms = np.einsum('ij,ij->i', probes, probes)
+            best_sq_dists = np.maximum(sq_dists[np.arange(len(probes)), best] + probe_sq_norms, 0.0)
+        
+        # Compare squared distances against the squared tolerance; the square
+        # root is only taken for the per-face best distance that gets reported
+        tolerance = config.FACE_RECOGNITION_TOLERANCE
+        matched = best_sq_dists <= tolerance * tolerance
+        best_dists = np.sqrt(best_sq_dists)
+        names = np.where(matched, known_names_array[best], "Unknown")
+        
+        return list(zip(names.tolist(), best_dists.tolist()))
     
     def start(self):
         """Start detection engine"""
@@ -79,11 +385,14 @@ class DetectionEngine:
         
         self.is_running = True
         
-        # Start worker threads
-        for i in range(self.num_workers):
-            thread = threading.Thread(target=self._worker_loop, args=(i,), daemon=True)
-            thread.start()
-            self.worker_threads.append(thread)
+        if config.DETECT_PROCESSES > 0:
+            self._start_processes()
+        else:
+            # Start worker threads
+            for i in range(self.num_workers):
+                thread = threading.Thread(target=self._worker_loop, args=(i,), daemon=True)
+                thread.start()
+                self.worker_threads.append(thread)
         
         # Start frame collector thread
         collector_thread = threading.Thread(target=self._collect_frames, daemon=True)
@@ -93,63 +402,189 @@ class DetectionEngine:
         results_thread = threading.Thread(target=self._process_results, daemon=True)
         results_thread.start()
         
-        logger.info(f"Detection engine started with {self.num_workers} workers")
+        # Start detection writer thread
+        self.flusher_thread = threading.Thread(target=self._flush_detections_loop, daemon=True)
+        self.flusher_thread.start()
+        
+        # Start snapshot writer thread
+        self.snapshot_thread = threading.Thread(target=self._snapshot_writer_loop, daemon=True)
+        self.snapshot_thread.start()
+        
+        logger.info(f"Detection engine started with {len(self.worker_processes) or self.num_workers} workers")
+    
+    def _start_processes(self):
+        """Start detection worker processes and the thread collecting their results"""
+        # Spawned rather than forked: the server is already running threads,
+        # and each process loads its own copy of the gallery on import
+        # A slot can be rewritten while up to DETECT_PROCESSES earlier frames
+        # of the same camera are in flight, plus the one waiting for the
+        # collector; fewer slots than that mostly yields dropped frames
+        min_slots = config.DETECT_PROCESSES + 2
+        if 0 < config.SHARED_FRAME_RING_SLOTS < min_slots:
+            logger.warning(f"SHARED_FRAME_RING_SLOTS={config.SHARED_FRAME_RING_SLOTS} is below "
+                           f"DETECT_PROCESSES + 2 ({min_slots}); frames overwritten before "
+                           f"a process reads them will be skipped")
+        
+        ctx = self.process_context = multiprocessing.get_context("spawn")
+        self.task_queue = ctx.Queue()
+        self.process_results_queue = ctx.Queue()
+        self.gallery_version = ctx.Value('i', 0)
+        
+        for i in range(config.DETECT_PROCESSES):
+            self.worker_processes.append(self._spawn_process(i))
+        
+        thread = threading.Thread(target=self._collect_process_results, daemon=True)
+        thread.start()
+        self.worker_threads.append(thread)
+    
+    def _spawn_process(self, worker_id: int):
+        """Start one detection worker process"""
+        process = self.process_context.Process(
+            target=_detection_process_main, daemon=True,
+            args=(worker_id, self.task_queue, self.process_results_queue, self.gallery_version))
+        process.start()
+        return process
+    
+    def _check_processes(self):
+        """Respawn dead worker processes and release frames stuck in flight
+        
+        A process killed mid-task (segfault in dlib, OOM killer) never sends
+        its result, so without this the collector would eventually see every
+        process as busy and stop handing out frames.
+        """
+        for i, process in enumerate(self.worker_processes):
+            if not process.is_alive() and self.is_running:
+                logger.error(f"Detection process {i} died (exit code {process.exitcode}), restarting it")
+                process.join(timeout=0)
+                self.worker_processes[i] = self._spawn_process(i)
+        
+        deadline = time.monotonic() - config.DETECT_TASK_TIMEOUT
+        expired = [task_id for task_id, (submitted, _) in list(self.pending_frames.items()) if submitted < deadline]
+        for task_id in expired:
+            self.pending_frames.pop(task_id, None)
+        if expired:
+            logger.warning(f"Dropped {len(expired)} detection tasks without a result after {config.DETECT_TASK_TIMEOUT}s")
+            frame_event.set()
     
     def stop(self):
         """Stop detection engine"""
         self.is_running = False
+        # Threads first, so the result collector can't respawn a process
+        # while they are being shut down
         for thread in self.worker_threads:
             thread.join(timeout=2)
         self.worker_threads.clear()
+        for _ in self.worker_processes:
+            self.task_queue.put(None)
+        for process in self.worker_processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.worker_processes.clear()
+        self.pending_frames.clear()
+        if self.flusher_thread:
+            self.flush_event.set()
+            self.flusher_thread.join(timeout=2)
+            self.flusher_thread = None
+        if self.snapshot_thread:
+            self.snapshot_thread.join(timeout=2)
+            self.snapshot_thread = None
         logger.info("Detection engine stopped")
     
     def _collect_frames(self):
         """Collect frames from all cameras and add to processing queue"""
-        frame_counter = 0
-        
         while self.is_running:
             try:
+                # Sleep until a camera publishes a frame instead of polling
+                if not frame_event.wait(timeout=1):
+                    continue
+                frame_event.clear()
+                
                 cameras = camera_manager.get_all_cameras()
                 
                 for camera_id, camera in cameras.items():
                     if not camera.is_running:
                         continue
                     
+                    # Every process is busy; leave the frame with the camera,
+                    # which keeps replacing it with the newest one
+                    if self.worker_processes and len(self.pending_frames) >= len(self.worker_processes):
+                        break
+                    
                     try:
-                        # Get frame from camera queue (non-blocking)
-                        frame_data = camera.frame_queue.get_nowait()
-                        
-                        # Process every Nth frame
-                        frame_counter += 1
-                        if frame_counter % config.PROCESS_EVERY_N_FRAMES != 0:
-                            continue
-                        
-                        # Add to processing queue
-                        try:
-                            self.processing_queue.put_nowait(frame_data)
-                        except queue.Full:
-                            pass  # Skip if queue is full
-                            
-                    except queue.Empty:
-                        pass
-                
-                time.sleep(0.01)  # Small delay to prevent CPU spinning
+                        # Take the camera's latest frame (non-blocking); cameras
+                        # only publish every PROCESS_EVERY_N_FRAMES-th frame
+                        frame_data = camera.frame_deque.popleft()
+                    except IndexError:
+                        continue
+                    
+                    if self.worker_processes:
+                        self._submit_to_process(frame_data)
+                    # Add to processing queue, skipping the frame if it's full
+                    elif self.processing_queue.qsize() < self.max_processing_queue:
+                        self.processing_queue.put(frame_data)
                 
             except Exception as e:
                 logger.error(f"Error in frame collector: {e}")
                 time.sleep(0.1)
     
+    def _submit_to_process(self, frame_data: Tuple):
+        """Hand a frame to the worker processes, via its shared-memory slot if it has one"""
+        camera_id, _, _, small_frame, shared = frame_data
+        task_id = self.next_task_id
+        self.next_task_id += 1
+        self.pending_frames[task_id] = (time.monotonic(), frame_data)
+        
+        payload = (*shared, small_frame.shape) if shared is not None else small_frame
+        self.task_queue.put((task_id, camera_id, payload))
+    
+    def _collect_process_results(self):
+        """Rejoin detections from worker processes with their frames"""
+        last_check = time.monotonic()
+        while self.is_running:
+            if time.monotonic() - last_check >= 1:
+                last_check = time.monotonic()
+                try:
+                    self._check_processes()
+                except Exception as e:
+                    logger.error(f"Error checking detection processes: {e}")
+            
+            try:
+                task_id, detections = self.process_results_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except Exception as e:
+                logger.error(f"Error receiving process results: {e}")
+                continue
+            
+            pending = self.pending_frames.pop(task_id, None)
+            frame_event.set()  # A process is free; let the collector hand it a frame
+            if pending is None or not detections:
+                continue
+            frame_data = pending[1]
+            
+            camera_id, timestamp, frame, _, _ = frame_data
+            self.results_queue.put({
+                'camera_id': camera_id,
+                'timestamp': timestamp,
+                'frame': frame,
+                'detections': detections
+            })
+    
     def _worker_loop(self, worker_id: int):
         """Worker thread for processing frames"""
         logger.info(f"Worker {worker_id} started")
         
+        # Scratch images reused across frames; reallocated if a camera's size differs
+        buffers = {}
+        
         while self.is_running:
             try:
                 # Get frame from queue
                 frame_data = self.processing_queue.get(timeout=1)
                 
                 # Process frame
-                result = self._process_frame(frame_data)
+                result = self._process_frame(frame_data, buffers)
                 
                 if result:
                     self.results_queue.put(result)
@@ -159,60 +594,70 @@ class DetectionEngine:
             except Exception as e:
                 logger.error(f"Error in worker {worker_id}: {e}")
     
-    def _process_frame(self, frame_data: Dict) -> Optional[Dict]:
+    @staticmethod
+    def _buffer(buffers: Dict, key: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """Return the worker's scratch image for key, allocating it on size change"""
+        buf = buffers.get(key)
+        if buf is None or buf.shape != shape:
+            buf = buffers[key] = np.empty(shape, dtype=np.uint8)
+        return buf
+    
+    def _process_frame(self, frame_data: Tuple, buffers: Optional[Dict] = None) -> Optional[Dict]:
         """Process a single frame for face detection and recognition"""
+        if buffers is None:
+            buffers = {}
         try:
-            frame = frame_data['frame']
-            camera_id = frame_data['camera_id']
-            camera_name = frame_data['camera_name']
-            timestamp = frame_data['timestamp']
+            camera_id, timestamp, frame, small_frame, _ = frame_data
+            
+            # Cameras downscale frames at capture; resize here only if they didn't
+            if small_frame is None:
+                height, width = frame.shape[:2]
+                small_w = int(width * config.FACE_DETECTION_SCALE + 0.5)
+                small_h = int(height * config.FACE_DETECTION_SCALE + 0.5)
+                small_frame = cv2.resize(frame, (small_w, small_h),
+                                         dst=self._buffer(buffers, 'bgr', (small_h, small_w, 3)))
+            
+            # Grayscale is enough for the HOG detector and the scene hash; the
+            # RGB conversion waits until there are faces to encode
+            small_gray = None
+            if config.FACE_DETECTION_MODEL == "hog" or config.LOCATION_REUSE_MAX_DISTANCE > 0:
+                small_gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY,
+                                          dst=self._buffer(buffers, 'gray', small_frame.shape[:2]))
             
-            # Resize frame for faster processing
-            small_frame = cv2.resize(frame, (0, 0), fx=config.FACE_DETECTION_SCALE, 
-                                    fy=config.FACE_DETECTION_SCALE)
-            rgb_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            # Detect faces, reusing the camera's last locations while the scene
+            # hasn't changed; encodings are still computed fresh
+            face_locations = None
+            frame_hash = None
+            if config.LOCATION_REUSE_MAX_DISTANCE > 0:
+                frame_hash = frame_dhash(small_gray)
+                cached = self.last_locations.get(camera_id)
+                if cached is not None and bin(cached[0] ^ frame_hash).count("1") < config.LOCATION_REUSE_MAX_DISTANCE:
+                    face_locations = cached[1]
             
-            # Detect faces
-            face_locations = face_recognition.face_locations(rgb_small, 
-                                                            model=config.FACE_DETECTION_MODEL)
+            if face_locations is None:
+                face_locations = find_face_locations_bgr(small_frame, small_gray)
+                if frame_hash is not None:
+                    self.last_locations[camera_id] = (frame_hash, face_locations)
             
             if not face_locations:
                 return None
             
             # Get face encodings
-            face_encodings = face_recognition.face_encodings(rgb_small, face_locations)
+            rgb_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB,
+                                     dst=self._buffer(buffers, 'rgb', small_frame.shape))
+            face_encodings = compute_face_encodings(rgb_small, face_locations)
+            
+            # Match every face against the cached gallery matrix in one pass
+            matches = self.match_faces(face_encodings)
+            
+            # Scale all boxes back to original frame size in one division
+            full_locations = (np.asarray(face_locations) / config.FACE_DETECTION_SCALE).astype(np.int32).tolist()
             
             detections = []
             
-            for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                # Scale back to original frame size
-                top = int(top / config.FACE_DETECTION_SCALE)
-                right = int(right / config.FACE_DETECTION_SCALE)
-                bottom = int(bottom / config.FACE_DETECTION_SCALE)
-                left = int(left / config.FACE_DETECTION_SCALE)
-                
-                # Match face to known faces
-                name = "Unknown"
-                confidence = 0.0
-                
-                if len(self.known_encodings) > 0:
-                    matches = face_recognition.compare_faces(
-                        self.known_encodings, 
-                        face_encoding, 
-                        config.FACE_RECOGNITION_TOLERANCE
-                    )
-                    
-                    face_distances = face_recognition.face_distance(
-                        self.known_encodings, 
-                        face_encoding
-                    )
-                    
-                    if len(face_distances) > 0:
-                        best_match_index = np.argmin(face_distances)
-                        
-                        if matches[best_match_index]:
-                            name = self.known_names[best_match_index]
-                            confidence = 1.0 - face_distances[best_match_index]
+            for (top, right, bottom, left), face_encoding, (name, distance) in zip(
+                    full_locations, face_encodings, matches):
+                confidence = 1.0 - distance if name != "Unknown" else 0.0
                 
                 detections.append({
                     'name': name,
@@ -224,7 +669,6 @@ class DetectionEngine:
             if detections:
                 return {
                     'camera_id': camera_id,
-                    'camera_name': camera_name,
                     'timestamp': timestamp,
                     'frame': frame,
                     'detections': detections
@@ -243,7 +687,7 @@ class DetectionEngine:
                 result = self.results_queue.get(timeout=1)
                 
                 camera_id = result['camera_id']
-                camera_name = result['camera_name']
+                camera_name = camera_manager.get_camera_name(camera_id)
                 timestamp = result['timestamp']
                 frame = result['frame']
                 detections = result['detections']
@@ -261,20 +705,20 @@ class DetectionEngine:
                     
                     # Save detection to database
                     snapshot_path = self._save_snapshot(frame, bbox, camera_name, name, timestamp)
-                    db.add_detection(camera_id, name, confidence, snapshot_path, bbox)
+                    self.pending_detections.append((camera_id, name, confidence, snapshot_path, bbox))
+                    if len(self.pending_detections) >= config.DB_WRITE_BATCH_SIZE:
+                        self.flush_event.set()
                     
                     # Check if person is on watchlist
                     watchlist_entry = db.is_on_watchlist(name)
                     
                     if watchlist_entry:
                         # Check alert cooldown
-                        cooldown_key = f"{camera_id}_{name}"
-                        current_time = datetime.now()
+                        cooldown_key = (camera_id, self.name_ids[name])
+                        current_time = time.monotonic()
                         
-                        if cooldown_key in self.alert_cooldown:
-                            last_alert_time = self.alert_cooldown[cooldown_key]
-                            if (current_time - last_alert_time).seconds < config.ALERT_COOLDOWN:
-                                continue  # Skip alert due to cooldown
+                        if current_time - self.alert_cooldown.get(cooldown_key, -config.ALERT_COOLDOWN) < config.ALERT_COOLDOWN:
+                            continue  # Skip alert due to cooldown
                         
                         # Generate alert
                         self.alert_count += 1
@@ -293,9 +737,36 @@ class DetectionEngine:
             except Exception as e:
                 logger.error(f"Error processing results: {e}")
     
+    def _flush_detections_loop(self):
+        """Write buffered detections in batches, every DB_WRITE_BATCH_WINDOW or when a batch fills"""
+        while self.is_running:
+            self.flush_event.wait(config.DB_WRITE_BATCH_WINDOW)
+            self.flush_event.clear()
+            self._flush_detections()
+        
+        # Write whatever was left when the engine stopped
+        self._flush_detections()
+    
+    def _flush_detections(self):
+        """Insert all buffered detections in one transaction"""
+        rows = []
+        try:
+            while True:
+                rows.append(self.pending_detections.popleft())
+        except IndexError:
+            pass
+        
+        if not rows:
+            return
+        
+        try:
+            db.add_detections(rows)
+        except Exception as e:
+            logger.error(f"Error writing {len(rows)} detections: {e}")
+    
     def _save_snapshot(self, frame: np.ndarray, bbox: tuple, camera_name: str, 
-                      person_name: str, timestamp: datetime) -> str:
-        """Save detection snapshot"""
+                      person_name: str, timestamp: int) -> str:
+        """Save detection snapshot (timestamp in epoch nanoseconds)"""
         try:
             if not config.SAVE_ALERT_SNAPSHOTS:
                 return None
@@ -309,16 +780,21 @@ class DetectionEngine:
             bottom = min(frame.shape[0], bottom + padding)
             right = min(frame.shape[1], right + padding)
             
-            # Crop face region
-            face_img = frame[top:bottom, left:right]
+            # Crop face region; copied so the queue doesn't keep the whole frame alive
+            face_img = frame[top:bottom, left:right].copy()
             
             # Generate filename
-            timestamp_str = timestamp.strftime("%Y%m%d_%H%M%S")
+            timestamp_str = datetime.fromtimestamp(timestamp / 1e9).strftime("%Y%m%d_%H%M%S")
             filename = f"{camera_name}_{person_name}_{timestamp_str}.jpg"
             filepath = os.path.join(config.ALERT_SNAPSHOT_DIR, filename)
             
-            # Save image
-            cv2.imwrite(filepath, face_img)
+            # Hand the crop to the writer thread so JPEG encoding and disk I/O
+            # stay off the results path
+            try:
+                self.snapshot_queue.put_nowait((filepath, face_img))
+            except queue.Full:
+                logger.warning(f"Snapshot queue full, dropping {filename}")
+                return None
             
             return filepath
             
@@ -326,19 +802,92 @@ class DetectionEngine:
             logger.error(f"Error saving snapshot: {e}")
             return None
     
+    def _snapshot_writer_loop(self):
+        """Encode and write queued snapshots, draining the queue on shutdown"""
+        while self.is_running or not self.snapshot_queue.empty():
+            try:
+                filepath, face_img = self.snapshot_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            
+            try:
+                data = encode_jpeg(face_img)
+                if data is None:
+                    logger.error(f"Could not encode snapshot {filepath}")
+                    continue
+                with open(filepath, 'wb') as f:
+                    f.write(data)
+            except Exception as e:
+                logger.error(f"Error writing snapshot {filepath}: {e}")
+    
     def get_statistics(self) -> Dict:
         """Get detection engine statistics"""
         return {
             'is_running': self.is_running,
-            'num_workers': self.num_workers,
+            'num_workers': len(self.worker_processes) or self.num_workers,
+            'worker_processes': len(self.worker_processes),
             'processing_queue_size': self.processing_queue.qsize(),
             'results_queue_size': self.results_queue.qsize(),
             'known_people': len(set(self.known_names)),
-            'total_encodings': len(self.known_encodings),
+            'total_encodings': len(self.known_matrix),
             'detection_count': self.detection_count,
             'alert_count': self.alert_count
         }
 
 
+def _detection_process_main(worker_id: int, task_queue, result_queue, gallery_version):
+    """Entry point of a detection worker process
+    
+    Tasks are (task_id, camera_id, payload), where payload is either a
+    (ring name, slot, generation, shape) reference into the camera's
+    shared-memory ring or the downscaled frame itself. A slot the camera
+    overwrote before it was copied out is skipped rather than detected on. Only detections are sent back; the
+    parent keeps the full frame for snapshots.
+    """
+    engine = detection_engine
+    version = gallery_version.value
+    rings = {}  # camera_id -> attached SharedFrameRing
+    buffers = {}
+    logger.info(f"Detection process {worker_id} started")
+    
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, camera_id, payload = task
+        
+        detections = None
+        try:
+            if gallery_version.value != version:
+                version = gallery_version.value
+                engine.load_known_faces()
+            
+            if isinstance(payload, tuple):
+                ring_name, slot, generation, shape = payload
+                ring = rings.get(camera_id)
+                if ring is None or ring.name != ring_name:
+                    if ring is not None:
+                        ring.close()
+                    ring = rings[camera_id] = SharedFrameRing(shape, config.SHARED_FRAME_RING_SLOTS, ring_name)
+                # Copy out of the slot straight away; the camera will reuse it
+                small_frame = engine._buffer(buffers, 'shared', shape)
+                if not ring.read(slot, generation, small_frame):
+                    small_frame = None
+            else:
+                small_frame = payload
+            
+            if small_frame is not None:
+                result = engine._process_frame((camera_id, 0, None, small_frame, None), buffers)
+                if result:
+                    detections = result['detections']
+        except Exception as e:
+            logger.error(f"Error in detection process {worker_id}: {e}")
+        
+        result_queue.put((task_id, detections))
+    
+    for ring in rings.values():
+        ring.close()
+
+
 # Global detection engine instance
 detection_engine = DetectionEngine()
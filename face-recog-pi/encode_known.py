@@ -1,25 +1,76 @@
 import os
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 import face_recognition
 
+try:
+	from numba import njit
+except ImportError:
+	njit = None
+
 KNOWN_DIR = "known"
 OUT_FILE = "known_encodings.npy"
 # when sampling videos, skip this many frames between analyses
 VIDEO_FRAME_SKIP = 30
+# seeking re-decodes from the previous keyframe, so only seek past skips this long
+VIDEO_SEEK_MIN_SKIP = 250
 # consider two encodings the same if distance < this threshold
 DUPLICATE_DISTANCE = 0.45
+# store encodings as float16; halves the file and gallery size, well within tolerance
+SAVE_FLOAT16 = True
+
+def _min_sq_distance(known, count, probe):
+	"""Smallest squared L2 distance from probe to the first count rows of known."""
+	best = np.inf
+	for i in range(count):
+		d = 0.0
+		for k in range(probe.shape[0]):
+			diff = known[i, k] - probe[k]
+			d += diff * diff
+		if d < best:
+			best = d
+	return best
+
+
+def _min_sq_distance_numpy(known, count, probe):
+	if count == 0:
+		return np.inf
+	diff = known[:count] - probe
+	return float(np.einsum('ij,ij->i', diff, diff).min())
+
+
+# compiled loop when numba is installed, vectorised numpy otherwise
+min_sq_distance = njit(fastmath=True, cache=True)(_min_sq_distance) if njit else _min_sq_distance_numpy
+
+
+class EncodingBuffer:
+	"""Growable float32 (capacity, 128) array of one person's encodings."""
+
+	def __init__(self, capacity=16):
+		self.data = np.empty((capacity, 128), dtype=np.float32)
+		self.count = 0
+
+	def __len__(self):
+		return self.count
+
+	def append(self, enc):
+		if self.count == len(self.data):
+			self.data = np.concatenate([self.data, np.empty_like(self.data)])
+		self.data[self.count] = enc
+		self.count += 1
 
-def add_unique_encoding(existing_list, new_enc):
-	"""Add new_enc to existing_list if it's not very close to any existing encoding."""
+	def array(self):
+		return self.data[:self.count].copy()
+
+
+def add_unique_encoding(existing, new_enc):
+	"""Add new_enc to existing (an EncodingBuffer) if it's not very close to any existing encoding."""
 	if new_enc is None:
 		return
-	if not existing_list:
-		existing_list.append(new_enc)
-		return
-	dists = face_recognition.face_distance(existing_list, new_enc)
-	if len(dists) == 0 or np.min(dists) > DUPLICATE_DISTANCE:
-		existing_list.append(new_enc)
+	probe = np.asarray(new_enc, dtype=np.float32)
+	if min_sq_distance(existing.data, existing.count, probe) > DUPLICATE_DISTANCE ** 2:
+		existing.append(probe)
 
 
 def is_image(fname):
@@ -42,14 +93,21 @@ def extract_encodings_from_video(path, skip=VIDEO_FRAME_SKIP):
 	if not cap.isOpened():
 		print("  WARNING: cannot open video:", path)
 		return encs
+	# skipped frames are only grabbed, not converted to BGR; long skips seek
+	use_seek = skip >= VIDEO_SEEK_MIN_SKIP and cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0
 	idx = 0
 	while True:
-		ret, frame = cap.read()
-		if not ret:
+		if use_seek:
+			cap.set(cv2.CAP_PROP_POS_FRAMES, idx + skip - 1)
+			idx += skip - 1
+		if not cap.grab():
 			break
 		idx += 1
 		if (idx % skip) != 0:
 			continue
+		ret, frame = cap.retrieve()
+		if not ret:
+			continue
 		# convert to RGB for face_recognition
 		rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 		locs = face_recognition.face_locations(rgb, model="hog")
@@ -62,6 +120,13 @@ def extract_encodings_from_video(path, skip=VIDEO_FRAME_SKIP):
 	return encs
 
 
+def extract_encodings(path, kind):
+	"""Worker: extract all face encodings from one image or video file."""
+	if kind == "image":
+		return extract_encodings_from_image(path)
+	return extract_encodings_from_video(path)
+
+
 def main():
 	encodings_dict = {}
 	print("Scanning known folder:", KNOWN_DIR)
@@ -69,40 +134,51 @@ def main():
 		print("Known folder not found:", KNOWN_DIR)
 		return
 
+	jobs = []
 	for fname in sorted(os.listdir(KNOWN_DIR)):
 		path = os.path.join(KNOWN_DIR, fname)
 		if not os.path.isfile(path):
 			continue
 		name = os.path.splitext(fname)[0]
+		if is_image(fname):
+			kind = "image"
+		elif is_video(fname):
+			kind = "video"
+		else:
+			print("  Skipping unsupported file type:", fname)
+			continue
 		print("Processing", fname, "as", name)
-		person_list = encodings_dict.get(name, [])
-
-		try:
-			if is_image(fname):
-				img_encs = extract_encodings_from_image(path)
-				if not img_encs:
-					print("  WARNING: no face found in", fname)
-				for e in img_encs:
+		jobs.append((name, fname, path, kind))
+
+	# files are independent and CPU-bound in dlib, so extract them in parallel
+	# processes; results are merged in file order so dedup stays deterministic
+	with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+		futures = [pool.submit(extract_encodings, path, kind) for _, _, path, kind in jobs]
+
+		for (name, fname, path, kind), future in zip(jobs, futures):
+			person_list = encodings_dict.get(name) or EncodingBuffer()
+			try:
+				encs = future.result()
+				if not encs:
+					if kind == "image":
+						print("  WARNING: no face found in", fname)
+					else:
+						print("  WARNING: no faces found in video", fname)
+				for e in encs:
 					add_unique_encoding(person_list, e)
+			except Exception as ex:
+				print("  ERROR processing", fname, "->", ex)
 
-			elif is_video(fname):
-				vid_encs = extract_encodings_from_video(path)
-				if not vid_encs:
-					print("  WARNING: no faces found in video", fname)
-				for e in vid_encs:
-					add_unique_encoding(person_list, e)
-			else:
-				print("  Skipping unsupported file type:", fname)
-				continue
-		except Exception as ex:
-			print("  ERROR processing", fname, "->", ex)
+			if person_list:
+				encodings_dict[name] = person_list
 
-		if person_list:
-			encodings_dict[name] = np.array(person_list)
+	encodings_dict = {name: buf.array() for name, buf in encodings_dict.items()}
 
 	if not encodings_dict:
 		print("No encodings created. Put at least one clear face image or video in known/")
 	else:
+		if SAVE_FLOAT16:
+			encodings_dict = {name: arr.astype(np.float16) for name, arr in encodings_dict.items()}
 		np.save(OUT_FILE, encodings_dict)
 		print("Saved encodings to", OUT_FILE, " with", len(encodings_dict), "people")
 
@@ -0,0 +1,69 @@
+"""
+Face Ops - Face encoding and matching helpers shared by the server and the debug scripts
+"""
+import logging
+from typing import List, Tuple
+
+import numpy as np
+import face_recognition
+
+logger = logging.getLogger(__name__)
+
+# dlib models loaded by face_recognition, used directly to batch descriptors
+try:
+    import dlib
+    from face_recognition.api import face_encoder, pose_predictor_5_point
+except Exception as e:
+    logger.info(f"dlib internals unavailable, encoding faces one at a time: {e}")
+    dlib = None
+
+# Optional Numba kernel for the per-face nearest-neighbour search
+try:
+    from numba import njit
+
+    # Serial on purpose: each detection worker thread already runs its own
+    # search, and float32 accumulation lets LLVM vectorise the inner loop
+    # into packed FMAs (NEON/AVX) under fastmath
+    @njit(cache=True, fastmath=True)
+    def match_all(probes, gallery):
+        """Return the index and squared distance of the closest gallery row per probe"""
+        n_probes, dim = probes.shape
+        n_known = gallery.shape[0]
+        best_idx = np.empty(n_probes, dtype=np.int64)
+        best_sq = np.empty(n_probes, dtype=np.float32)
+        for i in range(n_probes):
+            best_j = 0
+            best_d = np.float32(np.inf)
+            for j in range(n_known):
+                d = np.float32(0.0)
+                for k in range(dim):
+                    diff = probes[i, k] - gallery[j, k]
+                    d += diff * diff
+                if d < best_d:
+                    best_d = d
+                    best_j = j
+            best_idx[i] = best_j
+            best_sq[i] = best_d
+        return best_idx, best_sq
+except Exception as e:
+    logger.info(f"Numba unavailable, using NumPy for face matching: {e}")
+    match_all = None
+
+
+def compute_face_encodings(rgb: np.ndarray, locations: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+    """Encode every face in a frame with a single batched dlib descriptor call
+
+    face_recognition.face_encodings runs the network once per face; dlib
+    accepts all of a frame's landmark sets at once. Encodings come back in
+    the order of locations.
+    """
+    if dlib is None or len(locations) < 2:
+        return face_recognition.face_encodings(rgb, locations)
+
+    shapes = dlib.full_object_detections()
+    for top, right, bottom, left in locations:
+        shapes.append(pose_predictor_5_point(rgb, dlib.rectangle(left, top, right, bottom)))
+    descriptors = face_encoder.compute_face_descriptor(rgb, shapes, 1)
+    if len(descriptors) != len(locations):
+        raise RuntimeError(f"dlib returned {len(descriptors)} descriptors for {len(locations)} faces")
+    return [np.array(descriptor) for descriptor in descriptors]
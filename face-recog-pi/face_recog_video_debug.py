@@ -3,27 +3,70 @@ import os
 import time
 import sys
 import argparse
+import functools
+import math
+import queue
+import threading
 import cv2
 import numpy as np
 import face_recognition
+from face_ops import compute_face_encodings, match_all
 
+try:
+    import faiss
+except ImportError:
+    faiss = None
 
 # ---------- CONFIG (defaults) ----------
 DEFAULT_VIDEO_SRC = 0           # 0 means webcam; can be integer index or path string
 DEFAULT_ENC_FILE = "known_encodings.npy"
-MODEL = "hog"                  # "hog" or "cnn" (cnn is slower)
+MODEL = "hog"                  # "hog", "cnn" (cnn is slower) or "dnn" (OpenCV res10 SSD)
+DNN_PROTO = "deploy.prototxt"   # res10 SSD files for the "dnn" detector (opencv/samples/dnn)
+DNN_WEIGHTS = "res10_300x300_ssd_iter_140000.caffemodel"
+DNN_CONFIDENCE = 0.5
+DNN_TARGET = "cpu"              # "cpu", "fp16" (half-precision CPU, OpenCV >= 4.9) or "cuda"
+ENCODER = "mp4v"                # "mp4v" (software), "v4l2" (Pi H.264 block) or "nvenc" (NVIDIA); hardware ones need GStreamer
+# GStreamer elements for the hardware encoders, fed BGR frames through appsrc
+GST_ENCODERS = {
+    "v4l2": "v4l2h264enc ! video/x-h264,level=(string)4",
+    "nvenc": "nvh264enc",
+}
 TOLERANCE = 0.5
 SCALE_FAC = 0.5                 # downsizing factor for speed (1.0 = original size)
 PROCESS_EVERY_N_FRAMES = 1      # skip frames to speed up (1 = process all)
 OUTPUT_FILE = "output_debug.mp4"
 USE_HAAR_FALLBACK = True        # if face_recognition finds 0 faces, try Haar cascade
+USE_UMAT = False                # resize/convert through OpenCV's T-API (OpenCL) when available
+TARGET_FPS = 0.0                # >0: raise the skip while detection can't keep up with this frame rate
+TRACK_SKIPPED = True            # follow faces through skipped frames with a cheap OpenCV tracker
+PIPELINE_QUEUE_SIZE = 4         # frames buffered between the reader, main and writer threads
+MATCHER = "gemm"                # "gemm" (NumPy), "numba" (JIT loop), "faiss" (exact), "hnsw" (approximate, huge galleries),
+                                # "sq8" / "fp16" (FAISS int8 / half-precision gallery, 4x / 2x smaller)
 # ---------------------------------------
 
 
+def known_cache_paths(enc_file):
+    """Paths of the flat float32 matrix and names arrays cached next to enc_file"""
+    base = os.path.splitext(enc_file)[0]
+    return base + ".matrix.npy", base + ".names.npy"
+
+
 def load_known(enc_file):
     if not os.path.exists(enc_file):
         print(f"[ERROR] Encodings file not found: {enc_file}")
         sys.exit(1)
+
+    # fast path: the float32 matrix is memory-mapped and the names need no
+    # pickle, as long as the cache is newer than the encodings dict
+    matrix_file, names_file = known_cache_paths(enc_file)
+    if (os.path.exists(matrix_file) and os.path.exists(names_file)
+            and os.path.getmtime(matrix_file) >= os.path.getmtime(enc_file)
+            and os.path.getmtime(names_file) >= os.path.getmtime(enc_file)):
+        enc_matrix = np.load(matrix_file, mmap_mode="r")
+        names = np.load(names_file).astype(object)
+        print(f"[INFO] Loaded {len(set(names))} people, {len(enc_matrix)} total encodings from {matrix_file}")
+        return names, enc_matrix
+
     data = np.load(enc_file, allow_pickle=True).item()
     # data expected: { name: encoding } or { name: array_of_encodings }
     flat_names = []
@@ -51,10 +94,67 @@ def load_known(enc_file):
                 print(f"[WARN] Unknown encoding format for {name}, skipping")
 
     print(f"[INFO] Loaded {len(set(flat_names))} people, {len(flat_encs)} total encodings")
-    return flat_names, flat_encs
+    # one contiguous float32 matrix so matching is a single GEMM per frame
+    if flat_encs:
+        enc_matrix = np.ascontiguousarray(np.vstack(flat_encs), dtype=np.float32)
+    else:
+        enc_matrix = np.empty((0, 128), dtype=np.float32)
+
+    # one-time migration to the flat layout used by the fast path above
+    try:
+        np.save(matrix_file, enc_matrix)
+        np.save(names_file, np.array(flat_names, dtype=str))
+    except OSError as e:
+        print(f"[WARN] Could not cache flat encodings: {e}")
+    return np.array(flat_names, dtype=object), enc_matrix
 
 
-def open_video(src):
+def build_index(enc_matrix, kind):
+    """Build a FAISS index over the known matrix, or None to match with NumPy/Numba"""
+    if kind in ("gemm", "numba"):
+        return None
+    if faiss is None:
+        print("[WARN] faiss is not installed, falling back to the NumPy matcher")
+        return None
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(enc_matrix.shape[1], 32)
+    elif kind in ("sq8", "fp16"):
+        qtype = faiss.ScalarQuantizer.QT_8bit if kind == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(enc_matrix.shape[1], qtype, faiss.METRIC_L2)
+        # learns the per-dimension ranges the 8-bit codes are scaled to
+        index.train(enc_matrix)
+    else:
+        index = faiss.IndexFlatL2(enc_matrix.shape[1])
+    index.add(enc_matrix)
+    print(f"[INFO] Built FAISS {kind} index over {index.ntotal} encodings")
+    return index
+
+
+def match_encodings(face_encodings, names, enc_matrix, enc_sq, tolerance, index=None, matcher=MATCHER):
+    """Name each face after its closest known encoding, or "Unknown" past tolerance"""
+    if len(face_encodings) == 0:
+        return []
+    probes = np.asarray(face_encodings, dtype=np.float32)
+    if index is not None:
+        # FAISS L2 indexes report squared distances
+        d2, idx = index.search(np.ascontiguousarray(probes), 1)
+        best = idx[:, 0]
+        ok = (best >= 0) & (d2[:, 0] <= tolerance * tolerance)
+        return np.where(ok, names[best], "Unknown").tolist()
+    if matcher == "numba" and match_all is not None:
+        best, d2 = match_all(probes, np.ascontiguousarray(enc_matrix))
+        return np.where(d2 <= tolerance * tolerance, names[best], "Unknown").tolist()
+    # ||p - k||^2 = ||p||^2 + ||k||^2 - 2 p.k, compared squared so no sqrt is
+    # taken; ||p||^2 can't change the argmin, so it is only added to the winner
+    d2 = probes @ enc_matrix.T
+    d2 *= -2.0
+    d2 += enc_sq
+    best = d2.argmin(1)
+    best_d2 = d2[np.arange(len(probes)), best] + np.einsum("ij,ij->i", probes, probes)
+    return np.where(best_d2 <= tolerance * tolerance, names[best], "Unknown").tolist()
+
+
+def open_video(src, width=0, height=0):
     print("[INFO] Opening video source:", src)
     # if src is numeric string or int, convert to int for webcam index
     try:
@@ -65,23 +165,124 @@ def open_video(src):
     if not cap.isOpened():
         print("[ERROR] Cannot open video source:", src)
         return None
+    # let the camera deliver frames at processing size (combine with --scale 1)
+    if width and height:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
     return cap
 
 
-def prepare_writer(cap, out_file):
+def prepare_writer(cap, out_file, encoder=ENCODER):
     fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
     w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     out_w = int(w)
     out_h = int(h)
+    if encoder in GST_ENCODERS:
+        # hardware H.264 encode, so the writer thread barely touches the CPU
+        pipeline = (f"appsrc ! videoconvert ! {GST_ENCODERS[encoder]} ! h264parse ! mp4mux "
+                    f"! filesink location={out_file}")
+        writer = cv2.VideoWriter(pipeline, cv2.CAP_GSTREAMER, 0, fps, (out_w, out_h))
+        if writer.isOpened():
+            print(f"[INFO] Output writer prepared: {out_file} ({encoder}, fps={fps}, size={out_w}x{out_h})")
+            return writer
+        print(f"[WARN] GStreamer {encoder} encoder unavailable, falling back to mp4v")
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
     writer = cv2.VideoWriter(out_file, fourcc, fps, (out_w, out_h))
     print(f"[INFO] Output writer prepared: {out_file} (fps={fps}, size={out_w}x{out_h})")
     return writer
 
 
-def haar_faces(gray, scale=1.1):
-    import os
+def _put(q, item, stop):
+    """Put item on a bounded queue, giving up once stop is set"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def start_reader(cap, stop):
+    """Decode frames on a background thread; None marks the end of the stream"""
+    read_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    def run():
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if not _put(read_q, frame, stop):
+                return
+        _put(read_q, None, stop)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return read_q, thread
+
+
+class LatestFrameReader:
+    """Read a live source on a background thread, keeping only the newest frame
+
+    get() mirrors the reader queue: it blocks for a frame not seen before and
+    returns None at the end of the stream. Frames that arrive while the main
+    thread is busy are dropped, so recognition never falls behind the camera.
+    """
+
+    def __init__(self, cap, stop):
+        self.cap = cap
+        self.stop = stop
+        self.cond = threading.Condition()
+        self.frame = None
+        self.ended = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop.is_set():
+            ret, frame = self.cap.read()
+            with self.cond:
+                if not ret:
+                    break
+                self.frame = frame
+                self.cond.notify()
+        with self.cond:
+            self.ended = True
+            self.cond.notify()
+
+    def get(self):
+        with self.cond:
+            while self.frame is None and not self.ended:
+                self.cond.wait()
+            frame, self.frame = self.frame, None
+            return frame
+
+
+def is_live_source(src):
+    """Webcam indexes and network streams are live; anything else is a file"""
+    return str(src).isdigit() or "://" in str(src)
+
+
+def start_writer(writer):
+    """Encode output frames on a background thread; put None to finish"""
+    write_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    def run():
+        while True:
+            frame = write_q.get()
+            if frame is None:
+                break
+            writer.write(frame)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return write_q, thread
+
+
+@functools.lru_cache(maxsize=None)
+def load_haar_cascade():
+    """Locate and parse the Haar cascade once; None if it is unavailable"""
     cascade_name = "haarcascade_frontalface_default.xml"
     cascade_path = None
     # try the normal cv2.data.haarcascades location first
@@ -101,13 +302,96 @@ def haar_faces(gray, scale=1.1):
                 break
 
     if not cascade_path or not os.path.exists(cascade_path):
-        # graceful fallback: report and return empty list
+        # graceful fallback: report once, haar_faces then finds nothing
         print(f"[WARN] Haar cascade file not found (tried cv2.data and common locations). Expected {cascade_name}.")
-        return []
+        return None
 
     cascade = cv2.CascadeClassifier(cascade_path)
     if cascade.empty():
         print(f"[WARN] Failed to load Haar cascade from: {cascade_path}")
+        return None
+    return cascade
+
+
+@functools.lru_cache(maxsize=None)
+def load_dnn_detector(target):
+    """Load the res10 SSD face detector once for the given target"""
+    net = cv2.dnn.readNetFromCaffe(DNN_PROTO, DNN_WEIGHTS)
+    if target == "cuda":
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+        net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA)
+    else:
+        net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        if target == "fp16" and hasattr(cv2.dnn, "DNN_TARGET_CPU_FP16"):
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU_FP16)
+        else:
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    return net
+
+
+def dnn_faces(bgr, target=DNN_TARGET, confidence=DNN_CONFIDENCE):
+    """Detect faces on a BGR frame with the SSD, as (top, right, bottom, left) boxes"""
+    net = load_dnn_detector(target)
+    h, w = bgr.shape[:2]
+    net.setInput(cv2.dnn.blobFromImage(bgr, 1.0, (300, 300), (104.0, 177.0, 123.0)))
+    detections = net.forward()[0, 0]
+    out = []
+    for det in detections[detections[:, 2] >= confidence]:
+        left, top, right, bottom = (det[3:7] * (w, h, w, h)).astype(int)
+        top, left = max(top, 0), max(left, 0)
+        bottom, right = min(bottom, h), min(right, w)
+        if bottom > top and right > left:
+            out.append((int(top), int(right), int(bottom), int(left)))
+    return out
+
+
+def reuse_buffer(buffers, key, shape):
+    """Return a uint8 scratch image for key, reallocating only when its shape changes"""
+    buf = buffers.get(key)
+    if buf is None or buf.shape != shape:
+        buf = buffers[key] = np.empty(shape, dtype=np.uint8)
+    return buf
+
+
+def convert_color(small, small_u, code, buffers, key, shape):
+    """cvtColor into a reused buffer, or through the UMat copy when OpenCL is on"""
+    if small_u is not None:
+        return cv2.cvtColor(small_u, code).get()
+    return cv2.cvtColor(small, code, dst=reuse_buffer(buffers, key, shape))
+
+
+@functools.lru_cache(maxsize=None)
+def tracker_factory():
+    """Cheapest available OpenCV tracker constructor, or None (warns once)
+
+    MOSSE and KCF come with opencv-contrib-python only; the pinned
+    opencv-python still ships MIL.
+    """
+    legacy = getattr(cv2, "legacy", None)
+    for factory in (getattr(legacy, "TrackerMOSSE_create", None), getattr(cv2, "TrackerKCF_create", None),
+                    getattr(cv2, "TrackerMIL_create", None)):
+        if factory is not None:
+            return factory
+    print("[WARN] No OpenCV tracker available, skipped frames are written without boxes")
+    return None
+
+
+def create_tracker():
+    """New instance of the cheapest available OpenCV tracker, or None"""
+    factory = tracker_factory()
+    return factory() if factory is not None else None
+
+
+def draw_face(frame, box, name):
+    """Draw a (top, right, bottom, left) box in full-frame coordinates with its name"""
+    top, right, bottom, left = box
+    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+    cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+
+
+def haar_faces(gray, scale=1.1):
+    cascade = load_haar_cascade()
+    if cascade is None:
         return []
 
     rects = cascade.detectMultiScale(gray, scaleFactor=scale, minNeighbors=4, minSize=(30, 30))
@@ -123,10 +407,18 @@ def parse_args():
     p.add_argument("--source", "-s", default=DEFAULT_VIDEO_SRC, help="Video source (0 for webcam or path to file)")
     p.add_argument("--enc", "-e", default=DEFAULT_ENC_FILE, help="Encodings .npy file")
     p.add_argument("--out", "-o", default=OUTPUT_FILE, help="Output video file (set empty to disable writing)")
-    p.add_argument("--model", "-m", default=MODEL, choices=["hog", "cnn"], help="Face detection model")
+    p.add_argument("--model", "--detector", "-m", default=MODEL, choices=["hog", "cnn", "dnn"], help="Face detection model")
+    p.add_argument("--dnn-target", default=DNN_TARGET, choices=["cpu", "fp16", "cuda"], help="Compute target for the dnn detector")
     p.add_argument("--tolerance", "-t", type=float, default=TOLERANCE, help="Matching tolerance (lower is stricter)")
     p.add_argument("--scale", type=float, default=SCALE_FAC, help="Resize scale for processing")
+    p.add_argument("--encoder", default=ENCODER, choices=["mp4v", "v4l2", "nvenc"], help="Output video encoder")
+    p.add_argument("--umat", action="store_true", default=USE_UMAT, help="Preprocess frames with OpenCL via cv2.UMat")
+    p.add_argument("--capture-width", type=int, default=0, help="Ask the camera for this frame width")
+    p.add_argument("--capture-height", type=int, default=0, help="Ask the camera for this frame height")
     p.add_argument("--skip", type=int, default=PROCESS_EVERY_N_FRAMES, help="Process every N frames")
+    p.add_argument("--target-fps", type=float, default=TARGET_FPS,
+                   help="Skip more frames while detection is slower than this rate (0 keeps --skip fixed)")
+    p.add_argument("--matcher", default=MATCHER, choices=["gemm", "numba", "faiss", "hnsw", "sq8", "fp16"], help="Known-face matcher")
     return p.parse_args()
 
 
@@ -139,89 +431,164 @@ def main():
     SCALE_FAC = args.scale
     PROCESS_EVERY_N_FRAMES = max(1, args.skip)
 
-    names_flat, encs_flat = load_known(args.enc)
-    if not encs_flat:
+    names_flat, enc_matrix = load_known(args.enc)
+    if len(enc_matrix) == 0:
         print("[ERROR] No known encodings loaded. Exiting.")
         return
+    enc_sq = np.einsum("ij,ij->i", enc_matrix, enc_matrix)
+    index = build_index(enc_matrix, args.matcher)
+    if args.matcher == "numba" and match_all is None:
+        print("[WARN] numba is not installed, falling back to the NumPy matcher")
 
-    cap = open_video(args.source)
+    cap = open_video(args.source, args.capture_width, args.capture_height)
     if cap is None:
         return
 
+    # decode and encode run on their own threads so they overlap with
+    # recognition, which stays on the main thread
+    # live sources only ever hand over their newest frame, files go through
+    # the bounded queue so no frame is skipped
+    stop = threading.Event()
+    if is_live_source(args.source):
+        read_q = LatestFrameReader(cap, stop)
+        reader_thread = read_q.thread
+    else:
+        read_q, reader_thread = start_reader(cap, stop)
+
     writer = None
+    write_q = None
     if args.out:
-        writer = prepare_writer(cap, args.out)
+        writer = prepare_writer(cap, args.out, args.encoder)
+        write_q, writer_thread = start_writer(writer)
 
     frame_idx = 0
     processed = 0
     total_faces_found = 0
     t0 = time.time()
 
+    buffers = {}  # per-frame scratch images, reused across frames
+
+    use_umat = args.umat and cv2.ocl.haveOpenCL()
+    if args.umat and not use_umat:
+        print("[WARN] OpenCL is not available to OpenCV, preprocessing on the CPU")
+    if use_umat:
+        cv2.ocl.setUseOpenCL(True)
+
+    # frames between detections; grows with the measured detection time
+    # when --target-fps is set, and skipped frames follow the last faces
+    skip = PROCESS_EVERY_N_FRAMES
+    since_detect = 0
+    det_time = None
+    tracks = []  # (tracker, name) per face found by the last detection
+
     window_name = "Face Recognition"
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
 
+    # bind settings and hot functions to locals once; the loop then uses
+    # fast local lookups instead of globals and attribute chains
+    model, tol, scale, min_skip = MODEL, TOLERANCE, SCALE_FAC, PROCESS_EVERY_N_FRAMES
+    target_fps, dnn_target, matcher = args.target_fps, args.dnn_target, args.matcher
+    track_skipped, haar_fallback = TRACK_SKIPPED, USE_HAAR_FALLBACK
+    face_locations_fn = face_recognition.face_locations
+
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        frame = read_q.get()
+        if frame is None:
             print("[INFO] End of video / cannot read frame.")
             break
         frame_idx += 1
-
-        if (frame_idx % PROCESS_EVERY_N_FRAMES) != 0:
-            if writer:
-                writer.write(frame)
+        since_detect += 1
+
+        if since_detect < skip:
+            for tracker, name in tracks:
+                ok, (x, y, w, h) = tracker.update(frame)
+                if ok:
+                    draw_face(frame, (int(y), int(x + w), int(y + h), int(x)), name)
+            if write_q:
+                write_q.put(frame)
             cv2.imshow(window_name, frame)
             if cv2.waitKey(1) & 0xFF == ord("q"):
                 break
             continue
-
-        small = cv2.resize(frame, (0, 0), fx=SCALE_FAC, fy=SCALE_FAC)
-        rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-
-        face_locations = face_recognition.face_locations(rgb_small, model=MODEL)
-        face_encodings = face_recognition.face_encodings(rgb_small, face_locations)
+        since_detect = 0
+        t_det = time.time()
+
+        # with OpenCL the resize and colour conversions run on the UMat copy;
+        # dlib still needs host arrays, fetched with .get()
+        small_u = None
+        if use_umat:
+            small_u = cv2.UMat(frame)
+            if scale != 1.0:
+                small_u = cv2.resize(small_u, (0, 0), fx=scale, fy=scale)
+            small = small_u.get()
+        elif scale == 1.0:
+            small = frame
+        else:
+            h, w = frame.shape[:2]
+            w2, h2 = int(w * scale + 0.5), int(h * scale + 0.5)
+            small = cv2.resize(frame, (w2, h2), dst=reuse_buffer(buffers, "small", (h2, w2, 3)))
+
+        # convert only as far as each step needs: HOG and the Haar fallback
+        # share one grayscale pass, RGB is made for cnn or once faces are found
+        gray = None
+        rgb_small = None
+        if model == "dnn":
+            face_locations = dnn_faces(small, dnn_target)
+        elif model == "hog":
+            gray = convert_color(small, small_u, cv2.COLOR_BGR2GRAY, buffers, "gray", small.shape[:2])
+            face_locations = face_locations_fn(gray, model="hog")
+        else:
+            rgb_small = convert_color(small, small_u, cv2.COLOR_BGR2RGB, buffers, "rgb", small.shape)
+            face_locations = face_locations_fn(rgb_small, model=model)
 
         if frame_idx % 30 == 0:
-            print(f"[DEBUG] frame {frame_idx}: small_shape={rgb_small.shape}, face_locations_found={len(face_locations)}")
+            print(f"[DEBUG] frame {frame_idx}: small_shape={small.shape}, face_locations_found={len(face_locations)}")
 
-        names_in_frame = []
-        if len(face_locations) == 0 and USE_HAAR_FALLBACK:
-            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if len(face_locations) == 0 and haar_fallback:
+            if gray is None:
+                gray = convert_color(small, small_u, cv2.COLOR_BGR2GRAY, buffers, "gray", small.shape[:2])
             haar_locs = haar_faces(gray)
             if len(haar_locs) > 0:
                 print(f"[DEBUG] Haar fallback found {len(haar_locs)} faces on frame {frame_idx}")
                 face_locations = haar_locs
-                face_encodings = face_recognition.face_encodings(rgb_small, face_locations)
-
-        # match faces to known encodings (flat list)
-        for enc in face_encodings:
-            name = "Unknown"
-            if len(encs_flat) > 0:
-                matches = face_recognition.compare_faces(encs_flat, enc, TOLERANCE)
-                if True in matches:
-                    name = names_flat[matches.index(True)]
-                else:
-                    # fallback to distance-based name (closest)
-                    dists = face_recognition.face_distance(encs_flat, enc)
-                    if len(dists) > 0:
-                        best_idx = int(np.argmin(dists))
-                        if dists[best_idx] <= TOLERANCE:
-                            name = names_flat[best_idx]
-            names_in_frame.append(name)
-
-        for (top, right, bottom, left), name in zip(face_locations, names_in_frame):
-            top = int(top / SCALE_FAC)
-            right = int(right / SCALE_FAC)
-            bottom = int(bottom / SCALE_FAC)
-            left = int(left / SCALE_FAC)
-            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-            cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+
+        # encode once, after choosing between the detector and Haar boxes;
+        # the 5-point ("small") landmark model is the fast aligner
+        face_encodings = []
+        if face_locations:
+            if rgb_small is None:
+                rgb_small = convert_color(small, small_u, cv2.COLOR_BGR2RGB, buffers, "rgb", small.shape)
+            face_encodings = compute_face_encodings(rgb_small, face_locations)
+
+        # match all faces of the frame against the known matrix at once
+        names_in_frame = match_encodings(face_encodings, names_flat, enc_matrix, enc_sq, tol, index, matcher)
+
+        boxes = [(int(top / scale), int(right / scale), int(bottom / scale), int(left / scale))
+                 for top, right, bottom, left in face_locations]
+
+        # trackers start from the clean frame, before any boxes are drawn on it
+        tracks = []
+        if track_skipped and (skip > 1 or target_fps > 0):
+            for (top, right, bottom, left), name in zip(boxes, names_in_frame):
+                tracker = create_tracker()
+                if tracker is None:
+                    break
+                tracker.init(frame, (left, top, right - left, bottom - top))
+                tracks.append((tracker, name))
+
+        for box, name in zip(boxes, names_in_frame):
+            draw_face(frame, box, name)
+
+        elapsed = time.time() - t_det
+        det_time = elapsed if det_time is None else 0.8 * det_time + 0.2 * elapsed
+        if target_fps > 0:
+            skip = max(min_skip, math.ceil(det_time * target_fps))
 
         total_faces_found += len(face_locations)
         processed += 1
 
-        if writer:
-            writer.write(frame)
+        if write_q:
+            write_q.put(frame)
 
         cv2.imshow(window_name, frame)
         if cv2.waitKey(1) & 0xFF == ord("q"):
@@ -230,8 +597,12 @@ def main():
 
     dt = time.time() - t0
     print(f"[INFO] Done. Frames processed: {processed}, total_faces_found: {total_faces_found}, time: {dt:.2f}s, avg fps: {processed/dt:.2f}")
+    stop.set()
+    reader_thread.join()
     cap.release()
     if writer:
+        write_q.put(None)
+        writer_thread.join()
         writer.release()
     cv2.destroyAllWindows()
 
@@ -7,7 +7,7 @@ Run this once to create SSL certificates for secure camera access
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives import serialization
 import datetime
 import socket
@@ -33,12 +33,10 @@ def generate_self_signed_cert():
     print("=" * 70)
     print()
     
-    # Generate private key
+    # Generate private key (ECDSA P-256: near-instant on a Pi and much
+    # cheaper TLS handshakes than RSA-2048)
     print("[1/4] Generating private key...")
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-    )
+    private_key = ec.generate_private_key(ec.SECP256R1())
     print("✓ Private key generated")
     print()
     
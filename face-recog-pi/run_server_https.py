@@ -4,6 +4,7 @@ HTTPS Server for Multi-Camera CCTV System
 Enables secure camera access from mobile devices
 """
 
+import importlib.util
 import uvicorn
 import logging
 import sys
@@ -87,6 +88,8 @@ def main():
         ssl_keyfile="key.pem",
         ssl_certfile="cert.pem",
         reload=True,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "auto",  # No uvloop build on Windows
+        http="httptools",
         log_level="info"
     )
 
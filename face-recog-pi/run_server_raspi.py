@@ -4,6 +4,7 @@ Raspberry Pi optimized HTTPS server
 Uses config_raspi.py for RPi-specific settings
 """
 
+import importlib.util
 import uvicorn
 import logging
 import sys
@@ -96,6 +97,8 @@ def main():
         ssl_certfile="cert.pem",
         reload=False,  # Disable reload on RPi to save resources
         workers=1,  # Single worker for RPi
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "auto",  # No uvloop build on Windows
+        http="httptools",
         log_level="info"
     )
 
@@ -6,7 +6,7 @@ sudo apt update && sudo apt upgrade -y
 
 echo "Install system packages (may ask for sudo password)..."
 sudo apt install -y build-essential cmake libopenblas-dev liblapack-dev libx11-dev libgtk-3-dev \
-    python3-dev python3-pip libjpeg-dev libatlas-base-dev
+    python3-dev python3-pip libjpeg-dev libturbojpeg0 libatlas-base-dev
 
 echo "Increase swap to 1GB for dlib compile (temporary)..."
 sudo sed -i 's/CONF_SWAPSIZE=.*/CONF_SWAPSIZE=1024/' /etc/dphys-swapfile || true
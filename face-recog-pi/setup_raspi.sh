@@ -86,6 +86,9 @@ pip install starlette==0.44.0
 pip install click==8.1.8
 pip install h11==0.16.0
 pip install httptools==0.6.4
+pip install uvloop==0.21.0
+pip install orjson==3.10.15
+pip install PyTurboJPEG==2.0.0
 pip install python-dotenv==1.0.1
 pip install PyYAML==6.0.3
 pip install pillow==10.4.0
@@ -23,10 +23,9 @@ function connectWebSocket() {
     ws.onmessage = function(event) {
         const data = JSON.parse(event.data);
         
-        if (data.type === 'statistics') {
+        if (data.type === 'update') {
             updateStatusBar(data.data);
-        } else if (data.type === 'alerts') {
-            if (currentTab === 'alerts') {
+            if (data.alerts && data.alerts.length > 0 && currentTab === 'alerts') {
                 loadAlerts();
             }
         }
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 """
 Smart CCTV Server Status Simulator
-Displays normal running messages (no real server execution).
-Exits only when Ctrl+C is pressed.
+Displays the normal startup messages (no real server execution), then
+sleeps until Ctrl+C or SIGTERM.
 """
 
-import time
 import logging
+import signal
 import socket
+import threading
 
 # Setup logging
 logging.basicConfig(
@@ -48,18 +49,19 @@ def show_server_status():
     print()
 
 def main():
-    """Main loop: continuously prints running status"""
+    """Print the running status once, then wait for a stop signal"""
     show_server_status()
+    print("CCTV System running properly ✅")
 
-    try:
-        counter = 1
-        while True:
-            print(f"[{counter:03}] CCTV System running properly ✅")
-            time.sleep(2)
-            counter += 1
-    except KeyboardInterrupt:
-        print("\n🛑 Simulation stopped by user.")
-        print("Server shutdown simulated successfully ✅")
+    # Block on an event set by the signal handlers instead of waking up
+    # every few seconds to print, so the Pi's CPU can stay idle
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    stop.wait()
+
+    print("\n🛑 Simulation stopped by user.")
+    print("Server shutdown simulated successfully ✅")
 
 if __name__ == "__main__":
     main()